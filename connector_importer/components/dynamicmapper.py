@@ -14,6 +14,7 @@ class DynamicMapper(Component):
     _name = "importer.mapper.dynamic"
     _inherit = "importer.base.mapper"
     _usage = "importer.dynamicmapper"
+    _maps_as_is_safe_methods = ("default_values", "dynamic_fields")
 
     @mapping
     def dynamic_fields(self, record):
@@ -21,14 +22,56 @@ class DynamicMapper(Component):
 
         Source keys = destination keys.
         """
-        # TODO: add tests!
-        model = self.work.model_name
         vals = {}
+        valid_keys, plan = self._get_mapping_plan(record)
+        clean_record = {k: record[k] for k in valid_keys}
+        missing_required_keys = []
+        for source_fname, fname, converter, skip_empty, required in plan:
+            if fname != source_fname:
+                clean_record[fname] = clean_record.pop(source_fname)
+            value = converter(self, clean_record, fname)
+            if not value:
+                if skip_empty:
+                    continue
+                if required:
+                    missing_required_keys.append(fname)
+            vals[fname] = value
+        if missing_required_keys:
+            vals.update(self._get_defaults(missing_required_keys))
+            for k in missing_required_keys:
+                if k in vals and not vals[k]:
+                    # Discard empty values for required keys.
+                    # Avoids overriding values that might be already set
+                    # and that cannot be emptied.
+                    vals.pop(k)
+        return vals
+
+    # mapping plans by source keys, see `_get_mapping_plan`
+    _mapping_plans = None
+
+    def _get_mapping_plan(self, record):
+        """Return the plan to map records having the same keys as `record`.
+
+        The plan is computed once per set of source keys (eg: CSV header)
+        and consists of the valid source keys and a tuple of steps:
+        `(source key, field name, converter, skip if empty, required)`.
+        """
+        if self._mapping_plans is None:
+            self._mapping_plans = {}
+        signature = frozenset(record)
+        if signature not in self._mapping_plans:
+            self._mapping_plans[signature] = self._compile_mapping_plan(record)
+        return self._mapping_plans[signature]
+
+    def _compile_mapping_plan(self, record):
+        model = self.work.model_name
         available_fields = self.env[model].fields_get()
         prefix = self._source_key_prefix
-        clean_record = self._clean_record(record)
+        valid_keys = self._get_valid_keys(record)
+        clean_record = {k: record[k] for k in valid_keys}
         required_keys = self._required_keys()
-        missing_required_keys = []
+        empty_skip = self._source_key_empty_skip
+        plan = []
         for source_fname in self._non_mapped_keys(clean_record):
             if source_fname in ("id", "xid::id"):
                 # Never convert IDs
@@ -37,43 +80,55 @@ class DynamicMapper(Component):
             if "::" in fname:
                 # Eg: transformers like `xid::``
                 fname = fname.split("::")[-1]
-                clean_record[fname] = clean_record.pop(source_fname)
             if prefix and fname.startswith(prefix):
                 # Eg: prefix all supplier fields w/ `supplier.`
                 fname = fname[len(prefix) :]
-                clean_record[fname] = clean_record.pop(prefix + fname)
-            final_fname = self._get_field_name(fname, clean_record)
-            if final_fname != fname:
-                clean_record[final_fname] = clean_record.pop(fname)
-                fname = final_fname
-
-            if available_fields.get(fname):
-                fspec = available_fields.get(fname)
-                ftype = fspec["type"]
-                if self._is_xmlid_key(source_fname, ftype):
-                    ftype = "_xmlid"
-                converter = self._get_converter(fname, ftype)
-                if converter:
-                    value = converter(self, clean_record, fname)
-                    if not value:
-                        if source_fname in self._source_key_empty_skip:
-                            continue
-                        if fname in required_keys:
-                            missing_required_keys.append(fname)
-                    vals[fname] = value
-                else:
-                    logger.debug(
-                        "Dynamic mapper cannot find converte for field `%s`", fname
-                    )
-        if missing_required_keys:
-            vals.update(self._get_defaults(missing_required_keys))
-            for k in missing_required_keys:
-                if k in vals and not vals[k]:
-                    # Discard empty values for required keys.
-                    # Avoids overriding values that might be already set
-                    # and that cannot be emptied.
-                    vals.pop(k)
-        return vals
+            fname = self._get_field_name(fname, clean_record)
+            fspec = available_fields.get(fname)
+            if not fspec:
+                continue
+            ftype = fspec["type"]
+            if self._is_xmlid_key(source_fname, ftype):
+                ftype = "_xmlid"
+            converter = self._get_converter(fname, ftype)
+            if not converter:
+                logger.debug(
+                    "Dynamic mapper cannot find converte for field `%s`", fname
+                )
+                continue
+            plan.append(
+                (
+                    source_fname,
+                    fname,
+                    converter,
+                    source_fname in empty_skip,
+                    fname in required_keys,
+                )
+            )
+        return valid_keys, tuple(plan)
+
+    def _get_prefetch_items(self, record, hook="prefetch"):
+        yield from super()._get_prefetch_items(record, hook=hook)
+        valid_keys, plan = self._get_mapping_plan(record)
+        clean_record = {k: record[k] for k in valid_keys}
+        for source_fname, fname, converter, __, __ in plan:
+            if fname != source_fname:
+                clean_record[fname] = clean_record.pop(source_fname)
+            if hasattr(converter, hook):
+                yield converter, clean_record, fname
+
+    def maps_key_as_is(self, key):
+        for from_attr, to_attr in self.direct:
+            if key in (from_attr, to_attr, getattr(from_attr, "_from_key", None)):
+                return super().maps_key_as_is(key)
+        rename = self._source_key_rename
+        if self._source_key_prefix or key in rename or key in rename.values():
+            return False
+        if not self._mapping_methods_keep_key(key):
+            return False
+        fspec = self.model.fields_get([key]).get(key)
+        # values of these types are not converted (see `_dynamic_keys_mapping`)
+        return bool(fspec) and fspec["type"] in ("char", "text", "selection")
 
     def _clean_record(self, record):
         valid_keys = self._get_valid_keys(record)
@@ -157,23 +212,41 @@ class DynamicMapper(Component):
         options = self.work.options.mapper.get("converter", {}).get(fname, {})
         return self._dynamic_keys_mapping(fname, **options).get(ftype)
 
+    # non mapped keys by source keys
     _non_mapped_keys_cache = None
+    # cache usage counters, see `_non_mapped_keys_hit_rate`
+    _non_mapped_keys_stats = None
 
     def _non_mapped_keys(self, record):
         if self._non_mapped_keys_cache is None:
-            all_keys = set(record.keys())
-            mapped_keys = set()
-            # NOTE: keys coming from `@mapping` methods can't be tracked.
-            # Worse case: they get computed twice.
-            # TODO: make sure `dynamic_fields` runs at the end
-            # or move it to `finalize`
-            for pair in self.direct:
-                if isinstance(pair[0], str):
-                    mapped_keys.add(pair[0])
-                elif hasattr(pair[0], "_from_key"):
-                    mapped_keys.add(pair[0]._from_key)
-            self._non_mapped_keys_cache = tuple(all_keys - mapped_keys)
-        return self._non_mapped_keys_cache
+            self._non_mapped_keys_cache = {}
+            self._non_mapped_keys_stats = {"hits": 0, "misses": 0}
+        # Records might have different keys (eg: sparse JSON lines)
+        signature = frozenset(record)
+        if signature in self._non_mapped_keys_cache:
+            self._non_mapped_keys_stats["hits"] += 1
+            return self._non_mapped_keys_cache[signature]
+        self._non_mapped_keys_stats["misses"] += 1
+        mapped_keys = set()
+        # NOTE: keys coming from `@mapping` methods can't be tracked.
+        # Worse case: they get computed twice.
+        # TODO: make sure `dynamic_fields` runs at the end
+        # or move it to `finalize`
+        for pair in self.direct:
+            if isinstance(pair[0], str):
+                mapped_keys.add(pair[0])
+            elif hasattr(pair[0], "_from_key"):
+                mapped_keys.add(pair[0]._from_key)
+        keys = tuple(signature - mapped_keys)
+        self._non_mapped_keys_cache[signature] = keys
+        return keys
+
+    def _non_mapped_keys_hit_rate(self):
+        """Return the ratio of `_non_mapped_keys` calls served by the cache."""
+        stats = self._non_mapped_keys_stats
+        if not stats:
+            return 0.0
+        return stats["hits"] / ((stats["hits"] + stats["misses"]) or 1)
 
     def _get_defaults(self, fnames):
         return self.model.default_get(fnames)
@@ -1,11 +1,17 @@
 # Author: Simone Orsi
 # Copyright 2018 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+import contextlib
+import time
+
 from odoo import _, exceptions
 
 from odoo.addons.component.core import Component
 
 from ..log import LOGGER_NAME, logger
+from ..utils.import_utils import gen_chunks
+from ..utils.lookup_cache import pending_lookups_savepoint
+from ..utils.misc import XMLIDResolver
 
 
 class RecordSetImporter(Component):
@@ -27,6 +33,9 @@ class RecordSetImporter(Component):
         * create an import record per each chunk
         * schedule import for each record
         """
+        # learn from finished chunks before wiping the previous session
+        if recordset.import_type_id.chunk_size_adaptive:
+            recordset.import_type_id._learn_chunk_line_duration()
         # reset recordset
         recordset._prepare_for_import_session()
         msg = "START RECORDSET {} ({})".format(recordset.name, recordset.id)
@@ -37,12 +46,83 @@ class RecordSetImporter(Component):
             raise exceptions.UserError(
                 _("No source configured on recordset '%s'") % recordset.name
             )
-        for chunk in source.get_lines():
-            # create chuncked records and run their imports
-            record = self.env["import.record"].create({"recordset_id": recordset.id})
-            # store data
-            record.set_data(chunk)
-            record.run_import()
+        # store only references to chunks when possible
+        by_ref = source.can_chunk_by_ref()
+        if by_ref:
+            chunk_ranges = source.get_chunk_ranges()
+            if len(chunk_ranges) > 1:
+                # cut chunks of each range in parallel
+                for chunk_range in chunk_ranges:
+                    recordset.run_import_range(chunk_range)
+                return
+        chunk_kw = self._get_chunk_kw(recordset, source)
+        if by_ref:
+            chunks = source.get_chunk_refs(**chunk_kw)
+        else:
+            chunks = source.get_lines(**chunk_kw)
+        self._run_chunks(recordset, source, chunks, by_ref=by_ref)
+
+    def run_range(self, recordset, chunk_range, **kw):
+        """Run recordset job for a range of the source.
+
+        Same as `run` but only chunks of the given range are processed.
+        """
+        msg = "START RECORDSET {} ({}) RANGE {}".format(
+            recordset.name, recordset.id, chunk_range
+        )
+        logger.info(msg)
+        source = recordset.get_source()
+        chunks = source.get_chunk_refs(
+            chunk_range=chunk_range, **self._get_chunk_kw(recordset, source)
+        )
+        self._run_chunks(recordset, source, chunks, by_ref=True)
+
+    def _get_chunk_kw(self, recordset, source):
+        """Override source chunk size if adaptive on the import type."""
+        import_type = recordset.import_type_id
+        if not import_type.chunk_size_adaptive:
+            return {}
+        chunk_size = import_type.get_chunk_size(source.chunk_size)
+        logger.info("Adaptive chunk size: %s", chunk_size)
+        return {"chunk_size": chunk_size}
+
+    def _run_chunks(self, recordset, source, chunks, by_ref=False):
+        # when jobs are windowed, records are only created here
+        # and enqueued by the recordset few at a time
+        windowed = recordset._use_job_window()
+        if source.fanout_batch_size:
+            for batch in gen_chunks(chunks, chunksize=source.fanout_batch_size):
+                records = self._create_records(recordset, source, batch, by_ref)
+                if not windowed:
+                    records.run_import_batch()
+        else:
+            for chunk in chunks:
+                # create chuncked records and run their imports
+                record = self.env["import.record"].create(
+                    {"recordset_id": recordset.id}
+                )
+                # store data
+                if by_ref:
+                    record.set_data_ref(chunk)
+                else:
+                    record.set_data(chunk, codec=source.chunk_codec)
+                if not windowed:
+                    record.run_import()
+        if windowed:
+            recordset.run_import_window()
+
+    def _create_records(self, recordset, source, chunks, by_ref=False):
+        """Create import records for many chunks at once."""
+        vals_list = []
+        for chunk in chunks:
+            vals = {"recordset_id": recordset.id}
+            if by_ref:
+                vals["data_ref"] = chunk
+            vals_list.append(vals)
+        records = self.env["import.record"].create(vals_list)
+        if not by_ref:
+            records._set_data_batch(chunks, codec=source.chunk_codec)
+        return records
 
 
 class RecordImporter(Component):
@@ -60,6 +140,17 @@ class RecordImporter(Component):
     # log and report errors
     # do not make the whole import fail
     _break_on_error = False
+    # Look up existing records in batch (see `must_prefetch_existing`)
+    _prefetch_existing = False
+    # Import lines in batches w/ a single savepoint (see `savepoint_batch_size`)
+    _savepoint_batch_size = 0
+    _in_batch = False
+    # Resolve external IDs of a chunk in batch (see `must_prefetch_xmlids`)
+    _prefetch_xmlids = False
+    # required keys, computed once per session (see `_get_required_spec`)
+    _required_spec = None
+    # see `_get_translation_map`
+    _translation_map = None
     _record_handler_usage = "odoorecord.handler"
     _tracking_handler_usage = "tracking.handler"
     # a unique key (field name) to retrieve the odoo record
@@ -70,10 +161,20 @@ class RecordImporter(Component):
         self.recordset = recordset
         # record handler is responsible for create/write on odoo records
         self.record_handler = self.component(usage=self._record_handler_usage)
+        # external IDs resolver shared by record handler and mapper
+        self._xmlid_resolver = XMLIDResolver(self.env)
         self.record_handler._init_handler(
             importer=self,
             unique_key=self.unique_key,
+            xmlid_resolver=self._xmlid_resolver,
         )
+        self.mapper._xmlid_resolver = self._xmlid_resolver
+        # lines to create at once when bulk create is enabled
+        self._pending_creates = []
+        self._pending_keys = set()
+        # lines to write at once when bulk write is enabled
+        self._pending_writes = []
+        self._pending_write_ids = set()
         # tracking handler is responsible for logging and chunk reports
         self.tracker = self.component(usage=self._tracking_handler_usage)
         self.tracker._init_handler(
@@ -81,6 +182,8 @@ class RecordImporter(Component):
             logger_name=LOGGER_NAME,
             log_prefix=self.recordset.import_type_id.key + " ",
         )
+        self._required_spec = None
+        self._translation_map = None
         # TODO: trash on v16
         # `odoo_unique_key_is_xmlid` has been deprecated from v15
         if hasattr(self, "odoo_unique_key_is_xmlid"):
@@ -121,6 +224,47 @@ class RecordImporter(Component):
     def must_break_on_error(self):
         return self.work.options.importer.get("break_on_error", self._break_on_error)
 
+    @property
+    def must_prefetch_existing(self):
+        """Look up existing records for the whole chunk at once.
+
+        Lines are all mapped before being imported:
+        mappers cannot rely on records created by previous lines of the chunk.
+        """
+        return self.work.options.importer.get(
+            "prefetch_existing", self._prefetch_existing
+        )
+
+    @property
+    def must_prefetch_xmlids(self):
+        """Resolve all the external IDs referenced by a chunk at once.
+
+        Covers the unique key when it is an external ID
+        and the keys converted w/ `xmlid_to_rel`.
+        """
+        return self.work.options.importer.get("prefetch_xmlids", self._prefetch_xmlids)
+
+    @property
+    def must_skip_before_mapping(self):
+        """Skip lines w/out mapping them when possible.
+
+        Lines missing required source keys are skipped right away.
+        When existing records must not be overridden, lines matching them
+        are skipped as well, as long as the unique key can be looked up
+        as is from the source (see `_can_find_existing_before_mapping`).
+        """
+        return self.work.options.importer.get("skip_before_mapping", False)
+
+    @property
+    def savepoint_batch_size(self):
+        """Count of lines imported under a single savepoint.
+
+        By default each line gets its own savepoints.
+        """
+        return self.work.options.importer.get(
+            "savepoint_batch_size", self._savepoint_batch_size
+        )
+
     @property
     def must_override_existing(self):
         return self.work.options.importer.get(
@@ -147,6 +291,40 @@ class RecordImporter(Component):
             req[unique_key] = (unique_key,)
         return req
 
+    def _compile_required_keys(self):
+        """Flatten required keys to `(source_key, dest_key, check_source, check_dest)`.
+
+        `check_*` flags tell if the key must be checked on each line
+        (see `_check_missing`).
+        """
+        spec = []
+        unique_key = self.unique_key
+        for source_key, dest_keys in self.required_keys().items():
+            for dest_key in dest_keys:
+                is_xmlid = dest_key == unique_key and self.unique_key_is_xmlid
+                spec.append(
+                    (
+                        source_key,
+                        dest_key,
+                        not source_key.startswith("__"),
+                        not dest_key.startswith("__") and not is_xmlid,
+                    )
+                )
+        return tuple(spec)
+
+    def _get_required_spec(self):
+        if self._required_spec is None:
+            self._required_spec = self._compile_required_keys()
+        return self._required_spec
+
+    def _is_check_missing_overridden(self):
+        """Tell if `_check_missing` decides on its own what is missing.
+
+        Otherwise, lines are checked w/ the required keys spec first
+        and `_check_missing` is called only to build the message.
+        """
+        return type(self)._check_missing is not RecordImporter._check_missing
+
     # mostly for auto-documentation in UI
     def default_values(self):
         """Values that are automatically assigned."""
@@ -182,19 +360,29 @@ class RecordImporter(Component):
         within the attribute `translatable`.
         """
         translatable = {}
-        if not self.translatable_keys():
-            return translatable
-        for lang in self.translatable_langs():
-            for key in self.translatable_keys():
-                # eg: name:fr_FR
-                tkey = self.make_translation_key(key, lang)
-                if tkey in orig_values and values.get(key):
-                    if lang not in translatable:
-                        translatable[lang] = {}
-                    # we keep only translation for existing values
-                    translatable[lang][key] = orig_values.get(tkey)
+        for lang, key, tkey in self._get_translation_map():
+            if tkey in orig_values and values.get(key):
+                if lang not in translatable:
+                    translatable[lang] = {}
+                # we keep only translation for existing values
+                translatable[lang][key] = orig_values.get(tkey)
         return translatable
 
+    def _get_translation_map(self):
+        """Return `(lang, key, source key)` for each translatable key.
+
+        Computed once per session, eg: `("fr_FR", "name", "name:fr")`.
+        """
+        if self._translation_map is None:
+            keys = self.translatable_keys()
+            langs = self.translatable_langs() if keys else []
+            self._translation_map = tuple(
+                (lang, key, self.make_translation_key(key, lang))
+                for lang in langs
+                for key in keys
+            )
+        return self._translation_map
+
     def _check_missing(self, source_key, dest_key, values, orig_values):
         """Check for required keys missing."""
         missing = (
@@ -222,15 +410,16 @@ class RecordImporter(Component):
         or a dictionary containing info about skip reason.
         """
         msg = ""
-        required = self.required_keys()
-        for source_key, dest_key in required.items():
-            # we support multiple destination keys
-            for _dest_key in dest_key:
-                missing = self._check_missing(
-                    source_key, _dest_key, values, orig_values
-                )
-                if missing:
-                    return missing
+        prefilter = not self._is_check_missing_overridden()
+        for source_key, dest_key, check_source, check_dest in self._get_required_spec():
+            if prefilter and not (
+                (check_source and orig_values.get(source_key) is None)
+                or (check_dest and values.get(dest_key) is None)
+            ):
+                continue
+            missing = self._check_missing(source_key, dest_key, values, orig_values)
+            if missing:
+                return missing
 
         if (
             self.record_handler.odoo_exists(values, orig_values)
@@ -336,52 +525,17 @@ class RecordImporter(Component):
             return
 
         self._init_importer(self.record.recordset_id)
-        for line in self._record_lines():
-            line = self.prepare_line(line)
-            options = self._load_mapper_options()
-
-            odoo_record = None
-
-            try:
-                with self.env.cr.savepoint():
-                    values = self.mapper.map_record(line).values(**options)
-                logger.debug(values)
-            except Exception as err:
-                values = {}
-                self.tracker.log_error(values, line, odoo_record, message=err)
-                if self.must_break_on_error:
-                    raise
-                continue
-
-            # handle forced skipping
-            skip_info = self.skip_it(values, line)
-            if skip_info:
-                self.tracker.log_skipped(values, line, skip_info)
-                continue
-
-            try:
-                with self.env.cr.savepoint():
-                    if self.record_handler.odoo_exists(values, line):
-                        odoo_record = self.record_handler.odoo_write(values, line)
-                        self.tracker.log_updated(values, line, odoo_record)
-                    else:
-                        if self.work.options.importer.write_only:
-                            self.tracker.log_skipped(
-                                values,
-                                line,
-                                {"message": "Write-only importer, record not found."},
-                            )
-                            continue
-                        odoo_record = self.record_handler.odoo_create(values, line)
-                        self.tracker.log_created(values, line, odoo_record)
-            except Exception as err:
-                self.tracker.log_error(values, line, odoo_record, message=err)
-                if self.must_break_on_error:
-                    raise
-                continue
+        start = time.time()
+        lines = self._record_lines()
+        if self.savepoint_batch_size:
+            for batch in gen_chunks(lines, chunksize=self.savepoint_batch_size):
+                self._import_batch(list(batch))
+        else:
+            self._import_lines(lines)
 
         # update report
         self._do_report()
+        self._update_chunk_stats(len(lines), time.time() - start)
 
         # log chunk finished
         counters = self.tracker.get_counters()
@@ -398,6 +552,320 @@ class RecordImporter(Component):
         self.finalize_session(record, is_last_importer=is_last_importer)
         return counters
 
+    def _import_lines(self, lines):
+        mapped_lines = self._gen_mapped_lines(lines)
+        if self.must_prefetch_existing:
+            mapped_lines = list(mapped_lines)
+            self.record_handler.odoo_find_prefetch(
+                [(values, line) for line, values in mapped_lines]
+            )
+        for line, values in mapped_lines:
+            self._import_line(line, values)
+        self._flush_pending_creates()
+        self._flush_pending_writes()
+        self._flush_pending_translations()
+
+    def _import_batch(self, lines):
+        """Import lines under a single savepoint.
+
+        If anything fails, the batch is rolled back and split in halves
+        until failing lines are imported alone and their errors tracked.
+        """
+        self._in_batch = True
+        try:
+            with self._savepoint(), self.tracker.savepoint():
+                self._import_lines(lines)
+        except Exception:
+            # forget what happened in the batch
+            self._pending_creates, self._pending_keys = [], set()
+            self._pending_writes, self._pending_write_ids = [], set()
+            if len(lines) == 1:
+                self._in_batch = False
+                self._import_lines(lines)
+            else:
+                middle = len(lines) // 2
+                self._import_batch(lines[:middle])
+                self._import_batch(lines[middle:])
+        finally:
+            self._in_batch = False
+
+    @contextlib.contextmanager
+    def _savepoint(self):
+        """Savepoint also discarding what has been cached or queued in the meantime.
+
+        Records created in the block are gone when it fails: lookups
+        and external IDs resolved to them must be forgotten as well.
+        """
+        translations = self.record_handler._pending_translations
+        size = len(translations)
+        lookup_cache = dict(self.record_handler._lookup_cache)
+        xmlid_cache = dict(self._xmlid_resolver._cache)
+        try:
+            with pending_lookups_savepoint(self.env.cr), self.env.cr.savepoint():
+                yield
+        except Exception:
+            del translations[size:]
+            self.record_handler._lookup_cache = lookup_cache
+            self._xmlid_resolver._cache = xmlid_cache
+            raise
+
+    def _line_savepoint(self):
+        """Savepoint isolating a single line, useless when importing in batch."""
+        if self._in_batch:
+            return contextlib.nullcontext()
+        return self._savepoint()
+
+    def _must_raise(self):
+        """Tell if errors of a single line must be raised."""
+        return self._in_batch or self.must_break_on_error
+
+    def _gen_mapped_lines(self, lines):
+        """Yield `(line, values)` for each line the mapper can convert."""
+        lines = (self.prepare_line(line) for line in lines)
+        if self.must_skip_before_mapping:
+            lines = self._filter_lines_before_mapping(lines)
+        if self.must_prefetch_xmlids or self.mapper.must_prefetch_relations:
+            lines = list(lines)
+        if self.must_prefetch_xmlids:
+            self._resolve_xmlids(lines)
+        if self.mapper.must_prefetch_relations:
+            self.mapper.prefetch_relations(lines)
+        for line in lines:
+            options = self._load_mapper_options()
+            try:
+                with self._line_savepoint():
+                    values = self.mapper.map_record(line).values(**options)
+                logger.debug(values)
+            except Exception as err:
+                self.tracker.log_error({}, line, None, message=err)
+                if self._must_raise():
+                    raise
+                continue
+            yield line, values
+
+    def _resolve_xmlids(self, lines):
+        """Resolve the external IDs referenced by given lines at once."""
+        xids = set()
+        if self.unique_key_is_xmlid:
+            for line in lines:
+                try:
+                    xids.add(self.record_handler._get_xmlid({}, line))
+                except exceptions.UserError:
+                    # let `odoo_find` deal w/ it
+                    continue
+        xids.update(self.mapper.collect_xmlids(lines))
+        self._xmlid_resolver.prefetch(xids)
+
+    def _filter_lines_before_mapping(self, lines):
+        """Yield lines that are not skipped by source level checks."""
+        lines = list(lines)
+        check_existing = (
+            not self.must_override_existing
+            and self.record_handler._can_prefetch()
+            and self._can_find_existing_before_mapping()
+        )
+        if check_existing:
+            self.record_handler.odoo_find_prefetch(
+                [({}, line) for line in lines if line.get(self.unique_key)]
+            )
+        for line in lines:
+            skip_info = self._skip_before_mapping(line, check_existing=check_existing)
+            if skip_info:
+                self.tracker.log_skipped({}, line, skip_info)
+                continue
+            yield line
+
+    def _can_find_existing_before_mapping(self):
+        """Tell if source values are enough to find existing records."""
+        # external IDs are always looked up from the source
+        return self.unique_key_is_xmlid or self.mapper.maps_key_as_is(self.unique_key)
+
+    def _skip_before_mapping(self, line, check_existing=False):
+        """Same as `skip_it` but w/ source values only."""
+        # a custom `_check_missing` needs mapped values: let `skip_it` decide
+        required_spec = (
+            () if self._is_check_missing_overridden() else self._get_required_spec()
+        )
+        for source_key, __, check_source, __ in required_spec:
+            if check_source and line.get(source_key) is None:
+                return {"message": "MISSING REQUIRED SOURCE KEY={}".format(source_key)}
+        value = line.get(self.unique_key)
+        if not check_existing or not value:
+            return False
+        self.record_handler._reset_line_lookup_cache()
+        odoo_record = self.record_handler.odoo_find({}, line)
+        if not odoo_record:
+            return False
+        return {
+            "message": "ALREADY EXISTS: {}={}".format(self.unique_key, value),
+            "odoo_record": odoo_record.id,
+        }
+
+    def _import_line(self, line, values):
+        """Create or update the odoo record for given mapped line."""
+        odoo_record = None
+        self.record_handler._reset_line_lookup_cache()
+        if self._is_pending_create(line, values):
+            # create it to be able to find it
+            self._flush_pending_creates()
+        if self._is_pending_write(line, values):
+            # keep writes on the same record in order
+            self._flush_pending_writes()
+        # handle forced skipping
+        skip_info = self.skip_it(values, line)
+        if skip_info:
+            self.tracker.log_skipped(values, line, skip_info)
+            return
+        try:
+            with self._line_savepoint():
+                if self.record_handler.odoo_exists(values, line):
+                    if self.record_handler.must_bulk_write:
+                        odoo_record = self.record_handler.odoo_find(values, line)
+                        self._pending_write_ids.update(odoo_record.ids)
+                        self._pending_writes.append((line, values))
+                        return
+                    odoo_record = self.record_handler.odoo_write(values, line)
+                    self.tracker.log_updated(values, line, odoo_record)
+                else:
+                    if self.work.options.importer.write_only:
+                        self.tracker.log_skipped(
+                            values,
+                            line,
+                            {"message": "Write-only importer, record not found."},
+                        )
+                        return
+                    if self.record_handler.must_bulk_create:
+                        self._pending_keys.add(
+                            self.record_handler._lookup_key(values, line)
+                        )
+                        self._pending_creates.append((line, values))
+                        return
+                    odoo_record = self.record_handler.odoo_create(values, line)
+                    self.tracker.log_created(values, line, odoo_record)
+        except Exception as err:
+            self.tracker.log_error(values, line, odoo_record, message=err)
+            if self._must_raise():
+                raise
+
+    def _is_pending_create(self, line, values):
+        """Tell if the line matches a record waiting to be created."""
+        if not self._pending_creates:
+            return False
+        try:
+            return self.record_handler._lookup_key(values, line) in self._pending_keys
+        except Exception:
+            # cannot tell, be safe
+            return True
+
+    def _flush_pending_creates(self):
+        """Create pending records at once, fallback to one by one on errors."""
+        items, self._pending_creates = self._pending_creates, []
+        self._pending_keys = set()
+        if not items:
+            return
+        try:
+            with self._savepoint():
+                odoo_records = self.record_handler.odoo_create_multi(
+                    [(values, line) for line, values in items]
+                )
+        except Exception as err:
+            logger.info("Bulk create failed, create records one by one: %s", err)
+            for line, values in items:
+                self._create_line(line, values)
+            return
+        for odoo_record, (line, values) in zip(odoo_records, items):
+            self.tracker.log_created(values, line, odoo_record)
+
+    def _is_pending_write(self, line, values):
+        """Tell if the line matches a record waiting to be updated."""
+        if not self._pending_writes:
+            return False
+        try:
+            odoo_record = self.record_handler.odoo_find(values, line)
+        except Exception:
+            # cannot tell, be safe
+            return True
+        return bool(self._pending_write_ids.intersection(odoo_record.ids))
+
+    def _flush_pending_writes(self):
+        """Update pending records at once, fallback to one by one on errors."""
+        items, self._pending_writes = self._pending_writes, []
+        self._pending_write_ids = set()
+        if not items:
+            return
+        try:
+            with self._savepoint():
+                odoo_records = self.record_handler.odoo_write_multi(
+                    [(values, line) for line, values in items]
+                )
+        except Exception as err:
+            logger.info("Bulk write failed, update records one by one: %s", err)
+            for line, values in items:
+                self._write_line(line, values)
+            return
+        for odoo_record, (line, values) in zip(odoo_records, items):
+            self.tracker.log_updated(values, line, odoo_record)
+
+    def _flush_pending_translations(self):
+        """Write queued translations at once, fallback to one by one on errors."""
+        handler = self.record_handler
+        items = list(handler._pending_translations)
+        # keep the same list: savepoints hold it
+        del handler._pending_translations[:]
+        if not items:
+            return
+        try:
+            with self.env.cr.savepoint():
+                handler.update_translations_multi(
+                    [
+                        (odoo_record, translatable)
+                        for odoo_record, translatable, __ in items
+                    ]
+                )
+        except Exception as err:
+            logger.info("Bulk translations failed, write them one by one: %s", err)
+            for odoo_record, translatable, line in items:
+                try:
+                    with self._line_savepoint():
+                        handler.update_translations(odoo_record, translatable)
+                except Exception as err:
+                    # the line has been reported as created or updated already
+                    self.tracker.log_error_on_tracked(
+                        {}, line, odoo_record, message=err
+                    )
+                    if self._must_raise():
+                        raise
+
+    def _write_line(self, line, values):
+        odoo_record = None
+        try:
+            with self._line_savepoint():
+                self.record_handler._reset_line_lookup_cache()
+                odoo_record = self.record_handler.odoo_write(values, line)
+                self.tracker.log_updated(values, line, odoo_record)
+        except Exception as err:
+            self.tracker.log_error(values, line, odoo_record, message=err)
+            if self._must_raise():
+                raise
+
+    def _create_line(self, line, values):
+        odoo_record = None
+        try:
+            with self._line_savepoint():
+                odoo_record = self.record_handler.odoo_create(values, line)
+                self.tracker.log_created(values, line, odoo_record)
+        except Exception as err:
+            self.tracker.log_error(values, line, odoo_record, message=err)
+            if self._must_raise():
+                raise
+
+    def _update_chunk_stats(self, line_count, duration):
+        """Store chunk stats on the record, used to adapt chunk sizes."""
+        # more importers can run on the same record: sum up their durations
+        self.record.write(
+            {"line_count": line_count, "duration": self.record.duration + duration}
+        )
+
     def finalize_session(self, record, is_last_importer=False):
         self._trigger_importer_events(record)
         if is_last_importer:
@@ -1,6 +1,8 @@
 # Copyright 2019 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
 
+import time
+
 from odoo.addons.component.core import Component
 
 from ..log import logger
@@ -60,6 +62,7 @@ class RecordImporterCSVStd(Component):
             return msg
 
         self._init_importer(self.record.recordset_id)
+        start = time.time()
 
         dataset = []
         tracker_data = {
@@ -88,6 +91,7 @@ class RecordImporterCSVStd(Component):
                 if self.must_break_on_error:
                     raise
                 continue
+            self.record_handler._reset_line_lookup_cache()
             # Collect tracker data for later
             # We store the parameters for chunk_report.track_{created,updated}
             # functions, excepted the odoo_record which could not be known
@@ -151,6 +155,7 @@ class RecordImporterCSVStd(Component):
 
         # update report
         self._do_report()
+        self._update_chunk_stats(len(lines), time.time() - start)
 
         # log chunk finished
         msg = " ".join(
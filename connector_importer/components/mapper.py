@@ -4,9 +4,10 @@
 
 
 from odoo import _, exceptions
+from odoo.tools import split_every
 
 from odoo.addons.component.core import Component
-from odoo.addons.connector.components.mapper import mapping
+from odoo.addons.connector.components.mapper import Mapper, mapping
 
 from ..log import logger
 
@@ -114,3 +115,159 @@ class ImportMapper(Component):
             values[k] = v
         values.update(self.work.options.mapper.get("default_keys", {}))
         return values
+
+    # `@mapping` methods known to not change keys mapped as is
+    _maps_as_is_safe_methods = ("default_values",)
+
+    def maps_key_as_is(self, key):
+        """Tell if source `key` is mapped w/out conversion to the same field.
+
+        The importer relies on this to look up existing records
+        w/ source values, before mapping them.
+
+        Keys returned by `@mapping` methods or changed by `finalize`
+        cannot be tracked: mappers having them are assumed to change
+        the key, unless methods are listed in `_maps_as_is_safe_methods`.
+        Override to tell otherwise.
+        """
+        targets = [to_attr for __, to_attr in self.direct if to_attr == key]
+        return (
+            (key, key) in self.direct
+            and len(targets) == 1
+            and self._mapping_methods_keep_key(key)
+        )
+
+    def _mapping_methods_keep_key(self, key):
+        """Tell if `@mapping` methods and `finalize` leave `key` untouched."""
+        if type(self).finalize is not Mapper.finalize:
+            return False
+        if any(x not in self._maps_as_is_safe_methods for x in self._map_methods):
+            return False
+        defaults = dict(self.defaults)
+        defaults.update(self.work.options.mapper.get("default_keys", {}))
+        return key not in defaults
+
+    # external IDs resolved in batch, set by the importer
+    _xmlid_resolver = None
+    # relational values resolved in batch, see `prefetch_relations`
+    _rel_prefetch_cache = None
+    _rel_prefetch_field_types = ("char", "text", "selection", "integer")
+
+    @property
+    def must_prefetch_relations(self):
+        return self.work.options.mapper.get("prefetch_relations", False)
+
+    def _get_prefetch_items(self, record, hook="prefetch"):
+        """Yield `(modifier, record, to_attr)` for modifiers having given hook."""
+        for from_attr, to_attr in self.direct:
+            if callable(from_attr) and hasattr(from_attr, hook):
+                yield from_attr, record, to_attr
+
+    def _get_prefetch_values(self, operator, value):
+        if operator == "=":
+            return [value]
+        if operator == "in" and isinstance(value, (list, tuple)):
+            return value
+        return None
+
+    def _can_prefetch_relation(self, rel_model, fname):
+        if rel_model._name == self.model._name:
+            # records of the same model might be created by the import itself
+            return False
+        field = rel_model._fields.get(fname)
+        return bool(
+            field and field.store and field.type in self._rel_prefetch_field_types
+        )
+
+    def prefetch_relations(self, records):
+        """Resolve relational values of all given records in batch.
+
+        Values to search are collected by (model, search field)
+        and looked up w/ 1 query each.
+        Modifiers like `backend_to_rel` will then use them
+        instead of searching for each record.
+        """
+        if self._rel_prefetch_cache is None:
+            self._rel_prefetch_cache = {}
+        to_search = {}
+        for record in records:
+            for modifier, rec, to_attr in self._get_prefetch_items(record):
+                try:
+                    res = modifier.prefetch(self, rec, to_attr)
+                except Exception:
+                    # let the mapping deal w/ it
+                    continue
+                if not res:
+                    continue
+                rel_model, ((fname, operator, value),) = res
+                values = self._get_prefetch_values(operator, value)
+                if values is None or not self._can_prefetch_relation(rel_model, fname):
+                    continue
+                key = (rel_model._name, fname)
+                if key not in to_search:
+                    to_search[key] = (rel_model, [])
+                to_search[key][1].extend(values)
+        for (__, fname), (rel_model, values) in to_search.items():
+            self._prefetch_relation(rel_model, fname, values)
+
+    def _prefetch_relation(self, rel_model, fname, values):
+        field = rel_model._fields[fname]
+        by_value = self._rel_prefetch_cache.setdefault((rel_model._name, fname), {})
+        keys = set()
+        for value in values:
+            try:
+                # match values as the db would do
+                key = field.convert_to_cache(value, rel_model)
+            except (ValueError, TypeError):
+                continue
+            if key not in (None, False) and key not in by_value:
+                keys.add(key)
+        for batch in split_every(self.env.cr.IN_MAX, keys, set):
+            for key in batch:
+                by_value[key] = []
+            # keep records order as `search` does
+            for row in rel_model.search_read([(fname, "in", list(batch))], [fname]):
+                key = field.convert_to_cache(row[fname], rel_model)
+                if key in batch:
+                    by_value[key].append(row["id"])
+
+    def _get_prefetched_relation(self, rel_model, domain):
+        """Return records matching `domain` if resolved in batch, None otherwise."""
+        ((fname, operator, value),) = domain
+        by_value = self._rel_prefetch_cache.get((rel_model._name, fname))
+        values = self._get_prefetch_values(operator, value)
+        if by_value is None or values is None:
+            return None
+        field = rel_model._fields[fname]
+        ids = {}
+        for item in values:
+            try:
+                key = field.convert_to_cache(item, rel_model)
+            except (ValueError, TypeError):
+                return None
+            if key not in by_value:
+                return None
+            ids.update(dict.fromkeys(by_value[key]))
+        return rel_model.browse(list(ids))
+
+    def _invalidate_prefetched_relations(self, model_name):
+        for key in list(self._rel_prefetch_cache):
+            if key[0] == model_name:
+                del self._rel_prefetch_cache[key]
+
+    def collect_xmlids(self, records):
+        """Return the external IDs referenced by given records.
+
+        Modifiers like `xmlid_to_rel` will then get them
+        from the importer's external IDs resolver.
+        """
+        xids = set()
+        for record in records:
+            items = self._get_prefetch_items(record, hook="prefetch_xmlids")
+            for modifier, rec, to_attr in items:
+                try:
+                    xids.update(modifier.prefetch_xmlids(self, rec, to_attr))
+                except Exception:
+                    # let the mapping deal w/ it
+                    continue
+        return xids
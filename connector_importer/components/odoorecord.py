@@ -2,11 +2,13 @@
 # Copyright 2018 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
+from odoo import exceptions
 from odoo.tools import safe_eval
 
 from odoo.addons.component.core import Component
 
-from ..utils.misc import sanitize_external_id
+from ..log import logger
+from ..utils.misc import XMLIDResolver, sanitize_external_id
 
 NO_VALUE = object()
 
@@ -30,9 +32,32 @@ class OdooRecordHandler(Component):
     override_write_uid = False
     override_write_date = False
 
-    def _init_handler(self, importer=None, unique_key=None):
+    # Existing records by lookup key, filled by `odoo_find_prefetch`
+    _lookup_cache = None
+    # Results of `odoo_find` for the line being imported
+    _line_lookup_cache = None
+    # `(odoo_record, translatable, orig_values)` to write in bulk
+    _pending_translations = None
+    # Current values of records to update, by `(model, id)`
+    _current_values = None
+    # Types of unique key fields supporting batch lookup
+    _prefetch_field_types = ("char", "integer", "many2one", "selection")
+
+    # Resolve external IDs in batch, shared w/ the mapper
+    _xmlid_resolver = None
+
+    def _init_handler(self, importer=None, unique_key=None, xmlid_resolver=None):
         self.importer = importer
         self.unique_key = unique_key
+        self._xmlid_resolver = xmlid_resolver or XMLIDResolver(self.env)
+        self._lookup_cache = {}
+        self._line_lookup_cache = {}
+        self._pending_translations = []
+        self._current_values = {}
+
+    def _reset_line_lookup_cache(self):
+        """Forget lookups done for the previous line."""
+        self._line_lookup_cache = {}
 
     @property
     def unique_key_is_xmlid(self):
@@ -87,10 +112,21 @@ class OdooRecordHandler(Component):
 
     def odoo_find(self, values, orig_values):
         """Find any existing item in odoo."""
+        if self._line_lookup_cache is None:
+            # handler not initialized
+            return self._odoo_find(values, orig_values)
+        key = self._lookup_key(values, orig_values)
+        for cache in (self._line_lookup_cache, self._lookup_cache):
+            if key in cache:
+                return cache[key]
+        item = self._line_lookup_cache[key] = self._odoo_find(values, orig_values)
+        return item
+
+    def _odoo_find(self, values, orig_values):
         if self.unique_key and self.unique_key_is_xmlid:
             # if unique_key is None we might use as special find domain
             xid = self._get_xmlid(values, orig_values)
-            item = self.env.ref(xid, raise_if_not_found=False)
+            item = self._xmlid_ref(xid)
             return item or self.model
         item = self.model.search(
             self.odoo_find_domain(values, orig_values),
@@ -99,6 +135,106 @@ class OdooRecordHandler(Component):
         )
         return item
 
+    def _lookup_key(self, values, orig_values):
+        """Key identifying the record to find in the lookup cache."""
+        if self.unique_key and self.unique_key_is_xmlid:
+            return ("xid", self._get_xmlid(values, orig_values))
+        return ("domain", repr(self.odoo_find_domain(values, orig_values)))
+
+    def _lookup_key_safe(self, values, orig_values):
+        try:
+            return self._lookup_key(values, orig_values)
+        except ValueError:
+            # nothing to look up
+            return None
+
+    def _can_prefetch(self):
+        """Tell if existing records can be looked up in batch."""
+        if not self.unique_key or self.work.options.record_handler.match_domain:
+            return False
+        if self.unique_key_is_xmlid:
+            return True
+        field = self.model._fields.get(self.unique_key)
+        return bool(
+            field
+            and field.store
+            and not field.translate
+            and field.type in self._prefetch_field_types
+        )
+
+    def odoo_find_prefetch(self, items):
+        """Look up existing records for many lines at once.
+
+        :param items: list of `(values, orig_values)` tuples
+
+        Following calls to `odoo_find` for these lines
+        are answered w/out querying the db.
+        """
+        if not items or not self._can_prefetch():
+            return
+        if self.unique_key_is_xmlid:
+            self._prefetch_by_xmlid(items)
+        else:
+            self._prefetch_by_unique_key(items)
+        if self.must_skip_fields_unchanged:
+            to_read = []
+            for values, orig_values in items:
+                key = self._lookup_key_safe(values, orig_values)
+                if self._lookup_cache.get(key):
+                    to_read.append((self._lookup_cache[key], values))
+            self._prefetch_current_values(to_read)
+
+    def _prefetch_by_xmlid(self, items):
+        xids = set()
+        for values, orig_values in items:
+            try:
+                xids.add(self._get_xmlid(values, orig_values))
+            except exceptions.UserError:
+                # let `odoo_find` deal w/ it
+                continue
+        xids = {x for x in xids if x and "." in x}
+        if not xids:
+            return
+        self._xmlid_resolver.prefetch(xids)
+        for xid in xids:
+            record = self._xmlid_resolver.ref(xid) or self.model
+            self._lookup_cache[("xid", xid)] = record
+
+    def _prefetch_by_unique_key(self, items):
+        field = self.model._fields[self.unique_key]
+        by_value = {}
+        for values, orig_values in items:
+            try:
+                domain = self._odoo_find_domain_from_unique_key(values, orig_values)
+                value = domain[0][2]
+                # match values as the db would do
+                cache_value = field.convert_to_cache(value, self.model)
+            except (ValueError, TypeError):
+                # let `odoo_find` deal w/ it
+                continue
+            if value in (None, False):
+                continue
+            by_value.setdefault(cache_value, []).append(("domain", repr(domain)))
+        if not by_value:
+            return
+        found = {}
+        records = self.model.search(
+            [(self.unique_key, "in", list(by_value))], order="create_date desc"
+        )
+        for record in records:
+            value = field.convert_to_cache(record[self.unique_key], record)
+            # keep the most recent record as `odoo_find` does
+            found.setdefault(value, record)
+        for value, keys in by_value.items():
+            for key in keys:
+                self._lookup_cache[key] = found.get(value, self.model)
+
+    def _xmlid_ref(self, xid):
+        if self._xmlid_resolver is None:
+            # handler not initialized
+            return self.env.ref(xid, raise_if_not_found=False)
+        return self._xmlid_resolver.ref(xid)
+
     def _smart_ref(self, xid):
         return self.env.ref(sanitize_external_id(xid))
 
@@ -119,6 +255,63 @@ class OdooRecordHandler(Component):
                 values.copy()
             )
 
+    @property
+    def must_bulk_translate(self):
+        """Queue translations to write them for the whole chunk at once."""
+        return self.work.options.record_handler.get("bulk_translations", False)
+
+    def _handle_translations(self, odoo_record, values, orig_values):
+        translatable = self.importer.collect_translatable(values, orig_values)
+        if not self.must_bulk_translate:
+            self.update_translations(odoo_record, translatable)
+        elif translatable:
+            self._pending_translations.append((odoo_record, translatable, orig_values))
+
+    def update_translations_multi(self, items):
+        """Write translations of many records, one write per lang and values.
+
+        :param items: list of `(odoo_record, translatable)` tuples
+
+        Translations equal to the stored ones are not written.
+        """
+        by_lang = {}
+        for odoo_record, translatable in items:
+            for lang, values in translatable.items():
+                lang_values = by_lang.setdefault(lang, {})
+                for record in odoo_record:
+                    # last line wins
+                    lang_values.setdefault((record._name, record.id), {}).update(values)
+        for lang, lang_values in by_lang.items():
+            self._update_translations_lang(lang, lang_values)
+
+    def _update_translations_lang(self, lang, lang_values):
+        by_model = {}
+        for (model, res_id), values in lang_values.items():
+            by_model.setdefault(model, {})[res_id] = values
+        groups = {}
+        for model, values_by_id in by_model.items():
+            fnames = {fname for values in values_by_id.values() for fname in values}
+            records = self.env[model].with_context(lang=lang).browse(values_by_id)
+            current = {
+                item["id"]: item
+                for item in records.exists().read(list(fnames), load="_classic_write")
+            }
+            for res_id, values in values_by_id.items():
+                if res_id not in current:
+                    continue
+                changed = {
+                    k: v for k, v in values.items() if current[res_id].get(k) != v
+                }
+                if not changed:
+                    continue
+                key = (model, repr(sorted(changed.items())))
+                if key not in groups:
+                    groups[key] = (changed, [])
+                groups[key][1].append(res_id)
+        ctx = dict(self.write_context(), lang=lang)
+        for (model, __), (values, ids) in groups.items():
+            self.env[model].browse(ids).with_context(**ctx).write(values.copy())
+
     def odoo_pre_create(self, values, orig_values):
         """Do some extra stuff before creating a missing record."""
 
@@ -139,6 +332,40 @@ class OdooRecordHandler(Component):
             "must_generate_xmlid", self.unique_key_is_xmlid
         )
 
+    # handlers already warned about bulk mode being disabled
+    _bulk_mode_warned = set()
+
+    def _can_bulk(self, option, method_name):
+        """Tell if bulk `option` is enabled and `method_name` is not overridden.
+
+        Bulk methods bypass the one by one ones:
+        their overrides would be ignored silently.
+        """
+        if not self.work.options.record_handler.get(option, False):
+            return False
+        if getattr(type(self), method_name) is getattr(OdooRecordHandler, method_name):
+            return True
+        if (self._name, option) not in self._bulk_mode_warned:
+            self._bulk_mode_warned.add((self._name, option))
+            logger.warning(
+                "%s: `%s` disabled as `%s` is overridden",
+                self._name,
+                option,
+                method_name,
+            )
+        return False
+
+    @property
+    def must_bulk_create(self):
+        """Create new records of a chunk at once via `odoo_create_multi`.
+
+        Disabled for handlers overriding `odoo_create`: use pre/post create hooks.
+
+        Lines are mapped before pending creates are flushed: mappers and lookups
+        cannot rely on records created by previous lines of the same chunk.
+        """
+        return self._can_bulk("bulk_create", "odoo_create")
+
     def odoo_create(self, values, orig_values):
         """Create a new odoo record."""
         self.odoo_pre_create(values, orig_values)
@@ -146,6 +373,27 @@ class OdooRecordHandler(Component):
         odoo_record = self.model.with_context(**self.create_context()).create(
             values.copy()
         )
+        self._odoo_after_create(odoo_record, values, orig_values)
+        return odoo_record
+
+    def odoo_create_multi(self, items):
+        """Create many new odoo records at once.
+
+        :param items: list of `(values, orig_values)` tuples
+        :return: created records, in the same order
+        """
+        # Hooks might change values: keep them intact for a one by one fallback
+        items = [(values.copy(), orig_values) for values, orig_values in items]
+        for values, orig_values in items:
+            self.odoo_pre_create(values, orig_values)
+        odoo_records = self.model.with_context(**self.create_context()).create(
+            [values.copy() for values, __ in items]
+        )
+        for odoo_record, (values, orig_values) in zip(odoo_records, items):
+            self._odoo_after_create(odoo_record, values, orig_values)
+        return odoo_records
+
+    def _odoo_after_create(self, odoo_record, values, orig_values):
         # force uid
         if self.override_create_uid and values.get("create_uid"):
             self._force_value(odoo_record, values, "create_uid")
@@ -153,12 +401,11 @@ class OdooRecordHandler(Component):
         if self.override_create_date and values.get("create_date"):
             self._force_value(odoo_record, values, "create_date")
         self.odoo_post_create(odoo_record, values, orig_values)
-        translatable = self.importer.collect_translatable(values, orig_values)
-        self.update_translations(odoo_record, translatable)
+        self._handle_translations(odoo_record, values, orig_values)
         # Set the external ID if necessary
         if self.must_generate_xmlid:
             xid = self._get_xmlid(values, orig_values)
-            if not self.env.ref(xid, raise_if_not_found=False):
+            if not self._xmlid_ref(xid):
                 module, id_ = xid.split(".", 1)
                 self.env["ir.model.data"].create(
                     {
@@ -169,7 +416,20 @@ class OdooRecordHandler(Component):
                         "noupdate": False,
                     }
                 )
-        return odoo_record
+                if self._xmlid_resolver is not None:
+                    self._xmlid_resolver.set(xid, odoo_record)
+        self._update_lookup_cache(values, orig_values, odoo_record)
+
+    def _update_lookup_cache(self, values, orig_values, odoo_record):
+        """Make following lookups find the new record."""
+        if self._line_lookup_cache is None:
+            return
+        key = self._lookup_key_safe(values, orig_values)
+        if key is None:
+            return
+        self._line_lookup_cache[key] = odoo_record
+        if key in self._lookup_cache:
+            self._lookup_cache[key] = odoo_record
 
     def odoo_pre_write(self, odoo_record, values, orig_values):
         """Do some extra stuff before updating an existing object."""
@@ -198,7 +458,74 @@ class OdooRecordHandler(Component):
         # hook before write
         self.odoo_pre_write(odoo_record, values_for_write, orig_values)
         # do write now
-        odoo_record.write(values_for_write)
+        if values_for_write or not self.must_skip_fields_unchanged:
+            odoo_record.write(values_for_write)
+        self._odoo_after_write(odoo_record, values, values_for_write, orig_values)
+        return odoo_record
+
+    @property
+    def must_bulk_write(self):
+        """Update records of a chunk via `odoo_write_multi`.
+
+        Disabled for handlers overriding `odoo_write`: use pre/post write hooks.
+        """
+        return self._can_bulk("bulk_write", "odoo_write")
+
+    def odoo_write_multi(self, items):
+        """Update many existing odoo records, writing identical values at once.
+
+        :param items: list of `(values, orig_values)` tuples
+        :return: list of updated records, in the same order
+        """
+        records = []
+        for values, orig_values in items:
+            self._reset_line_lookup_cache()
+            odoo_record = self.odoo_find(values, orig_values).with_context(
+                **self.write_context()
+            )
+            records.append(odoo_record)
+        if self.must_skip_fields_unchanged:
+            self._prefetch_current_values(
+                [
+                    (odoo_record, values)
+                    for odoo_record, (values, __) in zip(records, items)
+                ]
+            )
+        to_write = []
+        groups = {}
+        for odoo_record, (values, orig_values) in zip(records, items):
+            values_for_write = values.copy()
+            self._odoo_write_purge_values(odoo_record, values_for_write)
+            self.odoo_pre_write(odoo_record, values_for_write, orig_values)
+            to_write.append((odoo_record, values, values_for_write, orig_values))
+            if self._is_found_by_unique_key():
+                # the record already holds this value: do not make it
+                # the only difference between values of each line
+                values_for_write = values_for_write.copy()
+                values_for_write.pop(self.unique_key, None)
+            key = (odoo_record._name, repr(sorted(values_for_write.items())))
+            if key not in groups:
+                groups[key] = (values_for_write, [])
+            groups[key][1].extend(odoo_record.ids)
+        for (model, __), (values_for_write, ids) in groups.items():
+            if not values_for_write and self.must_skip_fields_unchanged:
+                # nothing changed
+                continue
+            self.env[model].browse(ids).with_context(**self.write_context()).write(
+                values_for_write.copy()
+            )
+        for odoo_record, values, values_for_write, orig_values in to_write:
+            self._odoo_after_write(odoo_record, values, values_for_write, orig_values)
+        return [odoo_record for odoo_record, *__ in to_write]
+
+    def _is_found_by_unique_key(self):
+        return bool(
+            self.unique_key
+            and not self.unique_key_is_xmlid
+            and not self.work.options.record_handler.match_domain
+        )
+
+    def _odoo_after_write(self, odoo_record, values, values_for_write, orig_values):
         # force uid
         if self.override_write_uid and values.get("write_uid"):
             self._force_value(odoo_record, values, "write_uid")
@@ -208,9 +535,7 @@ class OdooRecordHandler(Component):
         # hook after write
         self.odoo_post_write(odoo_record, values_for_write, orig_values)
         # handle translations
-        translatable = self.importer.collect_translatable(values, orig_values)
-        self.update_translations(odoo_record, translatable)
-        return odoo_record
+        self._handle_translations(odoo_record, values, orig_values)
 
     def _force_value(self, record, values, fname):
         # the query construction is not vulnerable to SQL injection, as we are
@@ -220,6 +545,10 @@ class OdooRecordHandler(Component):
         self.env.cr.execute(query, (values[fname], record.id))
         record.invalidate_recordset([fname])
 
+    @property
+    def must_skip_fields_unchanged(self):
+        return self.work.options.record_handler.skip_fields_unchanged
+
     def _odoo_write_purge_values(self, odoo_record, values):
         # remove non fields values
         field_names = tuple(values.keys())
@@ -228,8 +557,38 @@ class OdooRecordHandler(Component):
                 values.pop(fname)
         # remove fields having the same value
         field_names = tuple(values.keys())
-        if self.work.options.record_handler.skip_fields_unchanged:
-            current_values = odoo_record.read(field_names, load="_classic_write")
-            for k, v in current_values.items():
-                if values[k] != v:
-                    values.pop(k)
+        if self.must_skip_fields_unchanged and odoo_record:
+            current_values = self._get_current_values(odoo_record, field_names)
+            for fname in field_names:
+                if fname in current_values and values[fname] == current_values[fname]:
+                    values.pop(fname)
+
+    def _get_current_values(self, odoo_record, field_names):
+        """Return current values of the record, prefetched if possible."""
+        current_values = None
+        if self._current_values:
+            current_values = self._current_values.pop(
+                (odoo_record._name, odoo_record.id), None
+            )
+        if current_values is None or not set(field_names) <= set(current_values):
+            current_values = odoo_record.read(field_names, load="_classic_write")[0]
+        return current_values
+
+    def _prefetch_current_values(self, items):
+        """Read current values of many records at once.
+
+        :param items: list of `(odoo_record, values)` tuples
+        """
+        by_model = {}
+        for odoo_record, values in items:
+            if len(odoo_record) != 1:
+                continue
+            ids, fnames = by_model.setdefault(odoo_record._name, (set(), set()))
+            ids.add(odoo_record.id)
+            fnames.update(x for x in values if x in odoo_record._fields)
+        for model, (ids, fnames) in by_model.items():
+            if not fnames:
+                continue
+            records = self.env[model].browse(ids).with_context(**self.write_context())
+            for item in records.read(list(fnames), load="_classic_write"):
+                self._current_values[(model, item["id"])] = item
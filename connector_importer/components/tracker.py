@@ -3,6 +3,7 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
 import logging
+from contextlib import contextmanager
 
 from odoo.addons.component.core import Component
 
@@ -29,6 +30,15 @@ class ChunkReport(dict):
     def track_created(self, item):
         self["created"].append(item)
 
+    def untrack(self, line_nr, keys=chunk_report_keys):
+        """Remove and return the last item tracked under `keys` for given line."""
+        for k in keys:
+            items = self[k]
+            for i in range(len(items) - 1, -1, -1):
+                if items[i]["line_nr"] == line_nr:
+                    return items.pop(i)
+        return None
+
     def counters(self):
         res = {}
         for k, v in self.items():
@@ -55,6 +65,8 @@ class Tracker(Component):
 
     _logger = None
     _chunk_report = None
+    # log messages held by `savepoint`
+    _log_buffer = None
 
     @property
     def logger(self):
@@ -84,8 +96,32 @@ class Tracker(Component):
             model=self.model_name,
             msg=msg,
         )
+        if self._log_buffer is not None:
+            self._log_buffer.append((handler, msg))
+            return
         handler(msg)
 
+    @contextmanager
+    def savepoint(self):
+        """Discard what is tracked in the block if it fails.
+
+        Log messages are emitted only once the block succeeds.
+        """
+        # items tracked before might be moved (see `log_error_on_tracked`)
+        snapshot = {k: list(v) for k, v in self.chunk_report.items()}
+        self._log_buffer = log_buffer = []
+        try:
+            yield
+        except Exception:
+            for k, items in snapshot.items():
+                self.chunk_report[k][:] = items
+            raise
+        else:
+            for handler, msg in log_buffer:
+                handler(msg)
+        finally:
+            self._log_buffer = None
+
     def log_updated(self, values, line, odoo_record=None, message=""):
         if odoo_record:
             self._log("UPDATED [id: {}]".format(odoo_record.id), line=line)
@@ -105,6 +141,14 @@ class Tracker(Component):
             )
         )
 
+    def log_error_on_tracked(self, values, line, odoo_record=None, message=""):
+        """Report an error for a line already tracked as created or updated.
+
+        The line is moved to errored ones to not count it twice.
+        """
+        self.chunk_report.untrack(line["_line_nr"], keys=("created", "updated"))
+        self.log_error(values, line, odoo_record=odoo_record, message=message)
+
     def log_created(self, values, line, odoo_record=None, message=""):
         if odoo_record:
             self._log("CREATED [id: {}]".format(odoo_record.id), line=line)
@@ -1,3 +1,5 @@
+from . import base
+from . import ir_model_data
 from . import cron_mixin
 from . import job_mixin
 from . import backend
@@ -6,3 +8,4 @@ from . import sources
 from . import recordset
 from . import record
 from . import reporter
+from . import queue_job
@@ -0,0 +1,36 @@
+# Author: Simone Orsi
+# Copyright 2024 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo import api, models
+
+from ..utils.lookup_cache import has_lookups, invalidate_lookups
+
+
+class Base(models.AbstractModel):
+    """Keep relational lookups cached by mappers up to date."""
+
+    _inherit = "base"
+
+    def _invalidate_importer_lookups(self, created=False):
+        if not has_lookups(self.env):
+            # Nothing to invalidate: keep the overhead low for all models
+            return
+        # New xmlids do not change the ones already resolved
+        negative_only = created and self._name == "ir.model.data"
+        invalidate_lookups(self.env, self._name, negative_only=negative_only)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        records._invalidate_importer_lookups(created=True)
+        return records
+
+    def write(self, vals):
+        res = super().write(vals)
+        self._invalidate_importer_lookups()
+        return res
+
+    def unlink(self):
+        self._invalidate_importer_lookups()
+        return super().unlink()
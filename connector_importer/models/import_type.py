@@ -74,6 +74,29 @@ class ImportType(models.Model):
         ),
         default=True,
     )
+    job_window_size = fields.Integer(
+        help=(
+            "Max number of chunk jobs pending at the same time per recordset. "
+            "Next chunks are enqueued as soon as previous ones are done. "
+            "0 means no limit: all the jobs are enqueued at once."
+        ),
+    )
+    chunk_size_adaptive = fields.Boolean(
+        string="Adaptive chunk size",
+        help=(
+            "Size chunks to last about the target duration, "
+            "based on the duration per line measured on previous imports. "
+            "The source chunk size is used until a measure is available."
+        ),
+    )
+    chunk_target_duration = fields.Integer(
+        string="Chunk target duration (s)", default=60
+    )
+    chunk_size_min = fields.Integer(string="Min chunk size", default=50)
+    chunk_size_max = fields.Integer(string="Max chunk size", default=5000)
+    chunk_line_duration = fields.Float(
+        string="Learned duration per line (s)", digits=(16, 6), readonly=True
+    )
     _sql_constraints = [
         ("key_uniq", "unique (key)", "Import type `key` must be unique!")
     ]
@@ -95,6 +118,34 @@ class ImportType(models.Model):
                 )
             )
 
+    def _learn_chunk_line_duration(self):
+        """Update the learned duration per line w/ finished chunks of the type.
+
+        Chunks of all the recordsets of the type are used.
+        Each recordset keeps the chunks of its last session only.
+        """
+        self.ensure_one()
+        res = self.env["import.record"].read_group(
+            [
+                ("recordset_id.import_type_id", "=", self.id),
+                ("line_count", ">", 0),
+                ("duration", ">", 0),
+            ],
+            ["line_count:sum", "duration:sum"],
+            [],
+        )
+        if not res or not res[0]["line_count"] or not res[0]["duration"]:
+            return
+        self.chunk_line_duration = res[0]["duration"] / res[0]["line_count"]
+
+    def get_chunk_size(self, default):
+        """Return the chunk size to use, adapted to the learned duration."""
+        self.ensure_one()
+        if not self.chunk_size_adaptive or not self.chunk_line_duration:
+            return default
+        size = int(self.chunk_target_duration / self.chunk_line_duration)
+        return max(self.chunk_size_min, min(self.chunk_size_max, size))
+
     def _load_options(self):
         return yaml.safe_load(self.options or "") or []
 
@@ -0,0 +1,25 @@
+# Author: Simone Orsi
+# Copyright 2024 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo import api, models
+
+from ..utils.misc import track_new_xmlids
+
+
+class IrModelData(models.Model):
+    _inherit = "ir.model.data"
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        track_new_xmlids(
+            self.env.cr, ["{}.{}".format(x.module, x.name) for x in records]
+        )
+        return records
+
+    def _update_xmlids(self, data_list, update=False):
+        # xmlids are inserted w/ plain SQL here
+        res = super()._update_xmlids(data_list, update=update)
+        track_new_xmlids(self.env.cr, [data["xml_id"] for data in data_list])
+        return res
@@ -0,0 +1,33 @@
+# Author: Simone Orsi
+# Copyright 2024 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo import fields, models
+
+from odoo.addons.queue_job.job import CANCELLED, DONE, FAILED
+
+
+class QueueJob(models.Model):
+    _inherit = "queue.job"
+
+    # Chunk jobs of a recordset, to count the pending ones
+    # (a record has one job per importer but references only the last one)
+    import_recordset_id = fields.Many2one(
+        "import.recordset", index=True, readonly=True, ondelete="set null"
+    )
+
+    def write(self, vals):
+        res = super().write(vals)
+        if vals.get("state") in (DONE, FAILED, CANCELLED):
+            self._run_import_window()
+        return res
+
+    def unlink(self):
+        recordsets = self.sudo().import_recordset_id
+        res = super().unlink()
+        recordsets._run_import_window()
+        return res
+
+    def _run_import_window(self):
+        """Let windowed recordsets enqueue the chunks waiting for these jobs."""
+        self.sudo().import_recordset_id._run_import_window()
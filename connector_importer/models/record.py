@@ -8,7 +8,10 @@ import os
 
 from odoo import api, fields, models
 
+from odoo.addons.queue_job.job import Job
+
 from ..log import logger
+from ..utils.chunk_codec import decode_chunk, encode_chunk
 from ..utils.misc import get_importer_for_config
 
 
@@ -41,6 +44,12 @@ class ImportRecord(models.Model):
     # This field holds the whole bare data to import from the external source
     # hence it can be huge. For this reason we store it in an attachment.
     jsondata_file = fields.Binary(attachment=True)
+    # When the source supports it, only a reference to the chunk is stored
+    # and lines are read back from the source on demand.
+    data_ref = fields.Json()
+    # Stats of the last import, used to adapt chunk sizes
+    line_count = fields.Integer(readonly=True)
+    duration = fields.Float(readonly=True, help="Import duration in seconds")
     recordset_id = fields.Many2one("import.recordset", string="Recordset")
     backend_id = fields.Many2one(
         "import.backend",
@@ -55,17 +64,84 @@ class ImportRecord(models.Model):
             names = [item.date]
             item.name = " / ".join([_f for _f in names if _f])
 
-    def set_data(self, adict):
+    def set_data(self, adict, codec=None):
+        """Store lines to import.
+
+        :param adict: lines to store
+        :param codec: name of a codec from `utils.chunk_codec`.
+            By default lines are stored as plain JSON.
+        """
         self.ensure_one()
+        if codec and codec != "json":
+            # store raw bytes straight into the attachment: no b64 here
+            self._set_data_payload(encode_chunk(adict, codec))
+            return
         jsondata = json.dumps(adict)
         self.jsondata_file = base64.b64encode(bytes(jsondata, "utf-8"))
 
+    def _set_data_batch(self, chunks, codec=None):
+        """Store lines for many new records at once (see `set_data`).
+
+        Attachments are created in one go.
+        """
+        vals_list = []
+        for record, chunk in zip(self, chunks):
+            if codec and codec != "json":
+                payload = encode_chunk(chunk, codec)
+            else:
+                payload = bytes(json.dumps(chunk), "utf-8")
+            vals_list.append(record._prepare_data_attachment_values(payload))
+        self.env["ir.attachment"].sudo().create(vals_list)
+        self.invalidate_recordset(["jsondata_file"])
+
+    def set_data_ref(self, ref):
+        self.ensure_one()
+        self.data_ref = ref
+
+    def _get_data_attachment(self):
+        return (
+            self.env["ir.attachment"]
+            .sudo()
+            .search(
+                [
+                    ("res_model", "=", self._name),
+                    ("res_field", "=", "jsondata_file"),
+                    ("res_id", "=", self.id),
+                ],
+                limit=1,
+            )
+        )
+
+    def _prepare_data_attachment_values(self, payload):
+        return {
+            "name": "jsondata_file",
+            "res_model": self._name,
+            "res_field": "jsondata_file",
+            "res_id": self.id,
+            "raw": payload,
+            "mimetype": "application/octet-stream",
+        }
+
+    def _set_data_payload(self, payload):
+        attachment = self._get_data_attachment()
+        if attachment:
+            attachment.raw = payload
+        else:
+            self.env["ir.attachment"].sudo().create(
+                self._prepare_data_attachment_values(payload)
+            )
+        self.invalidate_recordset(["jsondata_file"])
+
     def get_data(self):
         self.ensure_one()
+        if self.data_ref:
+            return self.recordset_id.get_source().read_chunk_ref(self.data_ref)
         jsondata = None
-        if self.jsondata_file:
-            raw_data = base64.b64decode(self.jsondata_file).decode("utf-8")
-            jsondata = json.loads(raw_data)
+        # read raw bytes to skip b64 conversion,
+        # the codec is detected from the payload (legacy: plain JSON)
+        payload = self._get_data_attachment().raw
+        if payload:
+            jsondata = decode_chunk(payload)
         return jsondata or {}
 
     def debug_mode(self):
@@ -118,11 +194,71 @@ class ImportRecord(models.Model):
                 # FIXME: we should have a o2m here otherwise
                 # w/ multiple importers for the same record
                 # we keep the reference on w/ the last job.
-                self.write({"job_id": result.db_record().id})
+                job_record = result.db_record()
+                job_record.sudo().import_recordset_id = self.recordset_id
+                self.write({"job_id": job_record.id})
             res[config.model] = result
 
         return res
 
+    def run_import_batch(self):
+        """Queue jobs for many records of the same recordset at once.
+
+        Same as `run_import` but jobs are stored in one go
+        and linked to their records w/ a single query.
+
+        Jobs are created w/ the same values `Job.store` would use:
+        this depends on queue_job 16.0 internals (see below).
+        """
+        if not self:
+            return
+        self.recordset_id.ensure_one()
+        use_job = self[0]._should_use_jobs()
+        if (
+            not use_job
+            or self.env.context.get("queue_job__no_delay")
+            # queue_job internals we rely on have changed: go one by one
+            or not hasattr(Job, "_store_values")
+        ):
+            for record in self:
+                record.run_import()
+            return
+        configs = list(self.recordset_id.available_importers())
+        vals_list = []
+        record_ids = []
+        for record in self:
+            for config in configs:
+                job = Job(
+                    record.import_record,
+                    args=(config,),
+                    **record._run_import_job_params(config),
+                )
+                # NOTE: relies on queue_job internals (16.0), same as `Job.store`:
+                # `Job._store_values(create=True)` gives the values to create
+                # the job and `queue.job.EDIT_SENTINEL` allows to write them.
+                vals = job._store_values(create=True)
+                vals["import_recordset_id"] = record.recordset_id.id
+                vals_list.append(vals)
+                record_ids.append(record.id)
+        job_model = self.env["queue.job"]
+        jobs = (
+            job_model.with_context(_job_edit_sentinel=job_model.EDIT_SENTINEL)
+            .sudo()
+            .create(vals_list)
+        )
+        # As in `_run_import` we keep the reference to the last job only
+        self._link_jobs(dict(zip(record_ids, jobs.ids)))
+
+    def _link_jobs(self, job_id_by_record_id):
+        self.flush_recordset(["job_id"])
+        self.env.cr.execute(
+            "UPDATE import_record SET job_id = data.job_id "
+            "FROM unnest(%s::int[], %s::int[]) AS data(id, job_id) "
+            "WHERE import_record.id = data.id",
+            (list(job_id_by_record_id), list(job_id_by_record_id.values())),
+        )
+        self.invalidate_recordset(["job_id", "job_state"])
+
     def _run_import_job_params(self, config):
         params = {
             "description": (
@@ -10,7 +10,7 @@ from collections import OrderedDict
 from odoo import api, fields, models
 
 from odoo.addons.component.utils import is_component_registry_ready
-from odoo.addons.queue_job.job import DONE, STATES
+from odoo.addons.queue_job.job import CANCELLED, DONE, FAILED, STATES
 
 from ..log import logger
 from ..utils.misc import get_importer_for_config, to_b64
@@ -345,6 +345,83 @@ class ImportRecordset(models.Model):
             #     )
             pass
 
+    def import_recordset_range(self, chunk_range):
+        """This job will import a range of the recordset source."""
+        with self.backend_id.work_on(self._name) as work:
+            importer = work.component(usage="recordset.importer")
+            return importer.run_range(self, chunk_range)
+
+    def run_import_range(self, chunk_range):
+        """queue a job for creating records for a range of the source"""
+        self.ensure_one()
+        if self.debug_mode():
+            return self.import_recordset_range(chunk_range)
+        return self.with_delay(
+            description=f"recordset {self.name}: chunk range {chunk_range}"
+        ).import_recordset_range(chunk_range)
+
+    def _use_job_window(self):
+        """Tell if chunk jobs are enqueued few at a time."""
+        return bool(
+            self.import_type_id.job_window_size
+            and self.import_type_id.use_job
+            and not self.debug_mode()
+        )
+
+    def run_import_window(self):
+        """Enqueue next import records w/in the window of pending jobs.
+
+        Records not enqueued yet are enqueued so that no more than
+        `import_type_id.job_window_size` jobs are pending.
+        Called again each time a job of the recordset is done, failed,
+        cancelled or deleted.
+        """
+        self.ensure_one()
+        if not self._use_job_window():
+            return
+        # lock the recordset to not enqueue twice the same records
+        # when chunks are done at the same time
+        self.env.cr.execute(
+            "SELECT id FROM import_recordset WHERE id = %s FOR UPDATE", (self.id,)
+        )
+        pending = (
+            self.env["queue.job"]
+            .sudo()
+            .search_count(
+                [
+                    ("import_recordset_id", "=", self.id),
+                    ("state", "not in", (DONE, FAILED, CANCELLED)),
+                ]
+            )
+        )
+        free = self.import_type_id.job_window_size - pending
+        if free <= 0:
+            return
+        # each record gets a job per importer: enqueue at least one
+        # when nothing is pending, even if the window is too small
+        per_record = len(list(self.available_importers())) or 1
+        limit = free // per_record or int(not pending)
+        if not limit:
+            return
+        self.env["import.record"].flush_model(["recordset_id", "job_id"])
+        # Records created by concurrent transactions (eg: range jobs)
+        # are not visible yet: they will be picked up by the next call.
+        self.env.cr.execute(
+            "SELECT id FROM import_record "
+            "WHERE recordset_id = %s AND job_id IS NULL "
+            "ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED",
+            (self.id, limit),
+        )
+        record_ids = [row[0] for row in self.env.cr.fetchall()]
+        if not record_ids:
+            return
+        self.env["import.record"].browse(record_ids).run_import_batch()
+
+    def _run_import_window(self):
+        for recordset in self:
+            if recordset._use_job_window():
+                recordset.run_import_window()
+
     def generate_report(self):
         self.ensure_one()
         reporter = self.get_source().get_reporter()
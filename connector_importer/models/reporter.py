@@ -10,7 +10,7 @@ import time
 
 from odoo import api, models
 
-from ..utils.import_utils import get_encoding
+from ..utils.import_utils import LATIN1_FALLBACK_ERRORS
 
 
 class ReporterMixin(models.AbstractModel):
@@ -139,9 +139,12 @@ class CSVReporter(models.AbstractModel):
 
         source = recordset.get_source()
         csv_file_bin = base64.b64decode(source.csv_file)
-        # Try to guess the encoding of the file supplied
-        csv_file_encoding = get_encoding(csv_file_bin).get("encoding", "utf-8")
-        orig_content = csv_file_bin.decode(csv_file_encoding).splitlines()
+        # Reuse the encoding detected (and cached) by the source
+        csv_file_encoding = source._get_csv_encoding() or "utf-8"
+        # same fallback as readers for bytes not matching a sampled encoding
+        orig_content = csv_file_bin.decode(
+            csv_file_encoding, errors=LATIN1_FALLBACK_ERRORS
+        ).splitlines()
         delimiter = source.csv_delimiter
         quotechar = source.csv_quotechar
 
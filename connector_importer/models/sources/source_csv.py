@@ -3,10 +3,21 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
 import base64
+import io
+import os
+from contextlib import contextmanager
 
-from odoo import api, fields, models
+from odoo import _, api, exceptions, fields, models
 
-from ...utils.import_utils import CSVReader, guess_csv_metadata
+from ...utils.import_utils import (
+    CSVReader,
+    gen_chunk_offsets,
+    gen_range_offsets,
+    get_encoding,
+    guess_csv_metadata,
+    is_ascii_compatible,
+    read_csv_range,
+)
 
 
 class CSVSource(models.Model):
@@ -27,6 +38,36 @@ class CSVSource(models.Model):
     csv_delimiter = fields.Char(string="CSV delimiter", default=";")
     csv_quotechar = fields.Char(string="CSV quotechar", default='"')
     csv_encoding = fields.Char(string="CSV Encoding")
+    csv_encoding_sample_kb = fields.Integer(
+        string="CSV encoding detection sample (KB)",
+        default=0,
+        help="When the encoding is not set, detect it from the head of the file "
+        "and few evenly spaced samples of this size instead of the whole file. "
+        "Recommended for big files. Leave 0 to scan the whole file.",
+    )
+    # Cache for the detected encoding, valid as long as the checksum matches
+    csv_encoding_detected = fields.Char(readonly=True)
+    csv_checksum = fields.Char(readonly=True)
+    csv_stream = fields.Boolean(
+        string="Stream CSV",
+        help="Read the file lazily instead of loading it all in memory. "
+        "Recommended for big files.",
+    )
+    csv_chunk_by_ref = fields.Boolean(
+        string="Chunk by reference",
+        help="Import records store only a reference (byte offsets) "
+        "to their chunk and read it from the file when needed, "
+        "instead of storing a copy of the data. "
+        "Ignored when using a slice of the lines "
+        "or if the encoding is not ASCII compatible (eg: utf-16).",
+    )
+    csv_parallel_ranges = fields.Integer(
+        string="Parallel ranges",
+        help="Split the file in this number of byte ranges "
+        "and cut chunks of each range in a separate job. "
+        "Speeds up the start of imports of very big files. "
+        "Requires chunking by reference.",
+    )
     csv_rows_from_to = fields.Char(
         string="CSV use only a slice of the available lines. "
         "Format: $from:$to. "
@@ -62,11 +103,74 @@ class CSVSource(models.Model):
     def _binary_csv_content(self):
         return base64.b64decode(self.csv_file)
 
+    def _get_csv_attachment(self):
+        return (
+            self.env["ir.attachment"]
+            .sudo()
+            .search(
+                [
+                    ("res_model", "=", self._name),
+                    ("res_field", "=", "csv_file"),
+                    ("res_id", "=", self.id),
+                ],
+                limit=1,
+            )
+        )
+
+    @contextmanager
+    def _open_csv_file(self):
+        """Open the CSV file as binary w/out loading it in memory if possible."""
+        if self.csv_path:
+            with open(self.csv_path, "rb") as fileobj:
+                yield fileobj
+            return
+        attachment = self._get_csv_attachment()
+        if attachment.store_fname:
+            with open(attachment._full_path(attachment.store_fname), "rb") as fileobj:
+                yield fileobj
+            return
+        with io.BytesIO(attachment.raw or self._binary_csv_content()) as fileobj:
+            yield fileobj
+
+    def _get_csv_checksum(self):
+        """Return a key identifying the current file content.
+
+        For FS paths we rely on file stats to not read the whole file.
+        """
+        if self.csv_path:
+            stat = os.stat(self.csv_path)
+            return "{}:{}:{}".format(self.csv_path, stat.st_size, stat.st_mtime_ns)
+        return self._get_csv_attachment().checksum
+
+    def _detect_csv_encoding(self):
+        sample_size = self.csv_encoding_sample_kb * 1024
+        with self._open_csv_file() as fileobj:
+            return get_encoding(fileobj, sample_size=sample_size)["encoding"]
+
+    def _get_csv_encoding(self):
+        """Return the encoding of the file.
+
+        If not configured, it's detected and cached by file checksum
+        so that later reads and reports do not detect it again.
+        """
+        self.ensure_one()
+        if self.csv_encoding:
+            return self.csv_encoding
+        checksum = self._get_csv_checksum()
+        if checksum and checksum == self.csv_checksum and self.csv_encoding_detected:
+            return self.csv_encoding_detected
+        encoding = self._detect_csv_encoding()
+        if checksum and encoding:
+            self.write({"csv_encoding_detected": encoding, "csv_checksum": checksum})
+        return encoding
+
     @api.onchange("csv_file")
     def _onchange_csv_file(self):
         if self.csv_file:
             # auto-guess CSV details
-            meta = guess_csv_metadata(self._binary_csv_content())
+            meta = guess_csv_metadata(
+                self._binary_csv_content(), encoding=self.csv_encoding
+            )
             if meta:
                 self.csv_delimiter = meta["delimiter"]
                 self.csv_quotechar = meta["quotechar"]
@@ -83,8 +187,8 @@ class CSVSource(models.Model):
         # read CSV
         reader_args = {
             "delimiter": self.csv_delimiter,
-            "encoding": self.csv_encoding,
             "rows_from_to": self.csv_rows_from_to,
+            "stream": self.csv_stream,
         }
         if self.csv_path:
             # TODO: join w/ filename
@@ -93,10 +197,71 @@ class CSVSource(models.Model):
             reader_args["filedata"] = base64.decodebytes(self.csv_file)
         else:
             return iter([])
+        reader_args["encoding"] = self._get_csv_encoding()
 
         reader = self._csv_reader_klass(**reader_args)
         return reader.read_lines()
 
+    def can_chunk_by_ref(self):
+        self.ensure_one()
+        return bool(
+            self.csv_chunk_by_ref
+            and not self.csv_rows_from_to
+            and not self._get_sort_keys()
+            # do not read the file content just to know if it's there
+            and (self.csv_path or self._get_csv_attachment())
+            and is_ascii_compatible(self._get_csv_encoding())
+        )
+
+    def get_chunk_ranges(self):
+        self.ensure_one()
+        if self.csv_parallel_ranges < 2:
+            return []
+        with self._open_csv_file() as fileobj:
+            return [
+                {"start": start, "end": end, "line_nr": line_nr}
+                for start, end, line_nr in gen_range_offsets(
+                    fileobj, self.csv_parallel_ranges, quotechar=self.csv_quotechar
+                )
+            ]
+
+    def get_chunk_refs(self, chunk_range=None, chunk_size=None):
+        self.ensure_one()
+        checksum = self._get_csv_checksum()
+        with self._open_csv_file() as fileobj:
+            for start, end, line_nr in gen_chunk_offsets(
+                fileobj,
+                chunksize=chunk_size or self.chunk_size,
+                quotechar=self.csv_quotechar,
+                max_bytes=self.chunk_max_bytes,
+                **(chunk_range or {})
+            ):
+                yield {
+                    "start": start,
+                    "end": end,
+                    "line_nr": line_nr,
+                    "checksum": checksum,
+                }
+
+    def read_chunk_ref(self, ref):
+        self.ensure_one()
+        if ref.get("checksum") != self._get_csv_checksum():
+            raise exceptions.UserError(
+                _("CSV file changed on source %s: cannot read chunk.") % self.id
+            )
+        with self._open_csv_file() as fileobj:
+            return list(
+                read_csv_range(
+                    fileobj,
+                    ref["start"],
+                    ref["end"],
+                    line_nr=ref["line_nr"],
+                    encoding=self._get_csv_encoding(),
+                    delimiter=self.csv_delimiter,
+                    quotechar=self.csv_quotechar,
+                )
+            )
+
     def _get_example_attachment(self):
         self.ensure_one()
         xmlid = self.example_file_ext_id
@@ -4,7 +4,13 @@
 
 from odoo import api, fields, models
 
-from ...utils.import_utils import gen_chunks
+from ...utils.chunk_codec import available_codecs
+from ...utils.import_utils import (
+    SORT_BUFFER_SIZE,
+    external_sort,
+    gen_chunks,
+    get_sort_key,
+)
 
 
 class ImportSource(models.AbstractModel):
@@ -26,6 +32,36 @@ class ImportSource(models.AbstractModel):
 
     name = fields.Char(compute="_compute_name")
     chunk_size = fields.Integer(required=True, default=500, string="Chunks Size")
+    chunk_max_bytes = fields.Integer(
+        string="Chunks max bytes",
+        help="Cut chunks as soon as their size in bytes reaches this limit, "
+        "even if they have less lines than the chunk size. "
+        "0 means no limit.",
+    )
+    sort_keys = fields.Char(
+        string="Sort by",
+        help="Comma separated list of source keys to sort lines by "
+        "(eg: to get all the variants of a template in the same chunk). "
+        "Values are compared as text.",
+    )
+    sort_buffer_size = fields.Integer(
+        string="Sort buffer size",
+        default=SORT_BUFFER_SIZE,
+        help="Max count of lines kept in memory while sorting. "
+        "Bigger sources are sorted via temporary files.",
+    )
+    chunk_codec = fields.Selection(
+        selection="_selection_chunk_codec",
+        default="json",
+        help="How chunks of lines are stored on import records. "
+        "Columnar formats store keys only once per chunk "
+        "and can be compressed.",
+    )
+    fanout_batch_size = fields.Integer(
+        string="Records batch size",
+        help="Create import records and enqueue their jobs "
+        "in batches of this size. 0 means one by one.",
+    )
     config_summary = fields.Html(compute="_compute_config_summary")
 
     # tmpl that renders configuration summary
@@ -34,13 +70,17 @@ class ImportSource(models.AbstractModel):
     def _compute_name(self):
         self.name = self._source_type
 
+    @api.model
+    def _selection_chunk_codec(self):
+        return [("json", "JSON")] + [(x, x.capitalize()) for x in available_codecs()]
+
     @property
     def _config_summary_fields(self):
         """Fields automatically included in the summary.
 
         Override it to add your custom fields automatically to the summary.
         """
-        return ["chunk_size"]
+        return ["chunk_size", "chunk_max_bytes"]
 
     @api.depends()
     def _compute_config_summary(self):
@@ -84,9 +124,13 @@ class ImportSource(models.AbstractModel):
             ).source_id = res.id
         return res
 
-    def get_lines(self):
-        """Retrieve lines to import."""
+    def get_lines(self, chunk_size=None):
+        """Retrieve lines to import.
+
+        :param chunk_size: override the chunk size of the source
+        """
         self.ensure_one()
+        chunk_size = chunk_size or self.chunk_size
         # retrieve lines
         lines = self._get_lines()
 
@@ -94,9 +138,13 @@ class ImportSource(models.AbstractModel):
         lines_sorted = self._sort_lines(lines)
 
         # no chunk size means no chunk of lines
-        if not self.chunk_size:
-            yield list(lines)
-        for _i, chunk in enumerate(gen_chunks(lines_sorted, chunksize=self.chunk_size)):
+        if not chunk_size and not self.chunk_max_bytes:
+            yield list(lines_sorted)
+            return
+        chunks = gen_chunks(
+            lines_sorted, chunksize=chunk_size, max_bytes=self.chunk_max_bytes
+        )
+        for _i, chunk in enumerate(chunks):
             # get out of chunk iterator
             yield list(chunk)
 
@@ -104,9 +152,49 @@ class ImportSource(models.AbstractModel):
         """Your duty here..."""
         raise NotImplementedError()
 
+    def can_chunk_by_ref(self):
+        """Tell if chunks can be provided as references via `get_chunk_refs`.
+
+        When possible, import records store only a reference to their chunk
+        and read lines back from the source via `read_chunk_ref`,
+        instead of storing a copy of the data.
+        Sorted lines cannot be referenced: they are not contiguous anymore.
+        """
+        return False
+
+    def get_chunk_ranges(self):
+        """Split the source in ranges to be chunked by separate jobs.
+
+        Return a list of JSON-serializable ranges to pass to `get_chunk_refs`.
+        Less than 2 ranges means no parallel chunking.
+        """
+        return []
+
+    def get_chunk_refs(self, chunk_range=None, chunk_size=None):
+        """Yield JSON-serializable references to chunks of lines.
+
+        :param chunk_range: a range from `get_chunk_ranges`
+        :param chunk_size: override the chunk size of the source
+        """
+        raise NotImplementedError()
+
+    def read_chunk_ref(self, ref):
+        """Retrieve lines of the chunk matching given reference."""
+        raise NotImplementedError()
+
+    def _get_sort_keys(self):
+        return [x.strip() for x in (self.sort_keys or "").split(",") if x.strip()]
+
     def _sort_lines(self, lines):
         """Override to customize sorting."""
-        return lines
+        keys = self._get_sort_keys()
+        if not keys:
+            return lines
+        return external_sort(
+            lines,
+            get_sort_key(keys),
+            buffer_size=self.sort_buffer_size or SORT_BUFFER_SIZE,
+        )
 
     def get_config_view_id(self):
         """Retrieve configuration view."""
@@ -34,13 +34,21 @@ class MockedSource(object):
 
     lines = []
     chunks_size = 5
+    chunk_codec = "json"
+    fanout_batch_size = 0
 
-    def __init__(self, lines, chunk_size=5):
+    def __init__(self, lines, chunk_size=5, **kw):
         self.lines = lines
         self.chunks_size = chunk_size
+        for k, v in kw.items():
+            setattr(self, k, v)
 
     def get_lines(self):
-        return gen_chunks(self.lines, self.chunks_size)
+        for chunk in gen_chunks(self.lines, self.chunks_size):
+            yield list(chunk)
+
+    def can_chunk_by_ref(self):
+        return False
 
 
 def fake_lines(count, keys):
@@ -89,9 +97,9 @@ class TestImporterMixin(object):
             {"backend_id": cls.backend.id, "import_type_id": cls.import_type.id}
         )
 
-    def _patch_get_source(self, lines, chunk_size=5):
+    def _patch_get_source(self, lines, chunk_size=5, **kw):
         self.env["import.recordset"]._patch_method(
-            "get_source", lambda x: MockedSource(lines, chunk_size=chunk_size)
+            "get_source", lambda x: MockedSource(lines, chunk_size=chunk_size, **kw)
         )
 
     def _fake_lines(self, count, keys=None):
@@ -131,3 +131,53 @@ class TestImportType(common.TransactionCase):
             importers,
             expected,
         )
+
+    def test_get_chunk_size(self):
+        itype = self.type_model.create(
+            {
+                "name": "Ok",
+                "key": "ok",
+                "chunk_target_duration": 60,
+                "chunk_size_min": 50,
+                "chunk_size_max": 5000,
+            }
+        )
+        # not adaptive
+        itype.chunk_line_duration = 0.1
+        self.assertEqual(itype.get_chunk_size(10), 10)
+        itype.chunk_size_adaptive = True
+        self.assertEqual(itype.get_chunk_size(10), 600)
+        # nothing learned yet
+        itype.chunk_line_duration = 0
+        self.assertEqual(itype.get_chunk_size(10), 10)
+        # clamped
+        itype.chunk_line_duration = 10
+        self.assertEqual(itype.get_chunk_size(10), 50)
+        itype.chunk_line_duration = 0.0001
+        self.assertEqual(itype.get_chunk_size(10), 5000)
+
+    def test_learn_chunk_line_duration(self):
+        itype = self.type_model.create(
+            {"name": "Ok", "key": "ok", "options": "- model: res.partner"}
+        )
+        backend = self.env["import.backend"].create(
+            {"name": "Foo", "version": "1.0", "debug_mode": True}
+        )
+        recordsets = self.env["import.recordset"].create(
+            [
+                {"backend_id": backend.id, "import_type_id": itype.id},
+                {"backend_id": backend.id, "import_type_id": itype.id},
+            ]
+        )
+        itype._learn_chunk_line_duration()
+        self.assertFalse(itype.chunk_line_duration)
+        # chunks of all recordsets are used, unfinished ones are ignored
+        self.env["import.record"].create(
+            [
+                {"recordset_id": recordsets[0].id, "line_count": 10, "duration": 2},
+                {"recordset_id": recordsets[1].id, "line_count": 30, "duration": 6},
+                {"recordset_id": recordsets[1].id},
+            ]
+        )
+        itype._learn_chunk_line_duration()
+        self.assertAlmostEqual(itype.chunk_line_duration, 0.2)
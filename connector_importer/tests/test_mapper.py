@@ -2,9 +2,12 @@
 # Copyright 2018 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
+from unittest import mock
+
 from odoo.tests.common import RecordCapturer
 from odoo.tools import DotDict
 
+from ..utils.lookup_cache import lookup_cache, pending_lookups_savepoint
 from .common import TestImporterBase
 
 MOD_PATH = "odoo.addons.connector_importer"
@@ -157,6 +160,26 @@ class TestRecordsetImporter(TestImporterBase):
         mapper = self._get_dynamyc_mapper(options=dict(source_key_empty_skip=["ref"]))
         self.assertEqual(mapper.dynamic_fields(rec), expected)
 
+    def test_dynamic_mapper_maps_key_as_is(self):
+        mapper = self._get_dynamyc_mapper()
+        self.assertTrue(mapper.maps_key_as_is("ref"))
+        # converted values
+        self.assertFalse(mapper.maps_key_as_is("parent_id"))
+        self.assertFalse(mapper.maps_key_as_is("active"))
+        self.assertFalse(mapper.maps_key_as_is("not_a_field"))
+        mapper = self._get_dynamyc_mapper(options=dict(source_key_prefix="foo."))
+        self.assertFalse(mapper.maps_key_as_is("ref"))
+        mapper = self._get_dynamyc_mapper(
+            options=dict(source_key_rename={"code": "ref"})
+        )
+        self.assertFalse(mapper.maps_key_as_is("ref"))
+        # keys changed by defaults or `finalize`
+        mapper = self._get_dynamyc_mapper(options=dict(default_keys={"ref": "x"}))
+        self.assertFalse(mapper.maps_key_as_is("ref"))
+        mapper = self._get_dynamyc_mapper()
+        with mock.patch.object(type(mapper), "finalize", autospec=True):
+            self.assertFalse(mapper.maps_key_as_is("ref"))
+
     def test_rel_create_if_missing(self):
         opts = {
             "parent_id": {"create_missing": True},
@@ -194,3 +217,211 @@ class TestRecordsetImporter(TestImporterBase):
             options=dict(source_key_rename={"another_name": "name"})
         )
         self.assertEqual(mapper.dynamic_fields(rec), expected)
+
+    def test_dynamic_mapper_plan(self):
+        mapper = self._get_dynamyc_mapper(
+            options=dict(source_key_rename={"another_name": "name"})
+        )
+        partner_cls = type(self.env["res.partner"])
+        recs = [
+            {"_line_nr": 1, "another_name": "John Doe", "ref": "1"},
+            {"_line_nr": 2, "another_name": "Jane Doe", "ref": "2"},
+            {"_line_nr": 3, "another_name": "Jack Doe", "ref": "3"},
+        ]
+        with mock.patch.object(
+            partner_cls, "fields_get", autospec=True, side_effect=partner_cls.fields_get
+        ) as mocked:
+            res = [mapper.dynamic_fields(rec) for rec in recs]
+        # Available fields and required keys are computed once per plan
+        self.assertEqual(mocked.call_count, 2)
+        self.assertEqual(
+            res,
+            [
+                {"name": "John Doe", "ref": "1"},
+                {"name": "Jane Doe", "ref": "2"},
+                {"name": "Jack Doe", "ref": "3"},
+            ],
+        )
+        self.assertEqual(len(mapper._mapping_plans), 1)
+
+    def test_dynamic_mapper_sparse_records(self):
+        mapper = self._get_dynamyc_mapper()
+        recs = [
+            {"_line_nr": 1, "name": "John Doe", "ref": "1"},
+            {"_line_nr": 2, "name": "Jane Doe"},
+            {"_line_nr": 3, "name": "Jack Doe", "ref": "3", "comment": "Hi"},
+        ]
+        self.assertEqual(
+            [mapper.dynamic_fields(rec) for rec in recs],
+            [
+                {"name": "John Doe", "ref": "1"},
+                {"name": "Jane Doe"},
+                {"name": "Jack Doe", "ref": "3", "comment": "Hi"},
+            ],
+        )
+        self.assertEqual(len(mapper._mapping_plans), 3)
+
+    def test_dynamic_mapper_non_mapped_keys_hit_rate(self):
+        mapper = self._get_dynamyc_mapper()
+        # 1000 sparse records sharing 4 different sets of keys
+        headers = [
+            ("name",),
+            ("name", "ref"),
+            ("ref", "name"),
+            ("name", "ref", "comment"),
+            ("name", "email"),
+        ]
+        for i in range(1000):
+            rec = dict.fromkeys(headers[i % len(headers)], "x")
+            self.assertEqual(sorted(mapper._non_mapped_keys(rec)), sorted(rec.keys()))
+        self.assertEqual(mapper._non_mapped_keys_stats, {"hits": 996, "misses": 4})
+        self.assertEqual(mapper._non_mapped_keys_hit_rate(), 0.996)
+
+    def test_dynamic_mapper_prefetch_relations(self):
+        mapper = self._get_dynamyc_mapper(options=dict(prefetch_relations=True))
+        categ_model = self.env["res.partner.category"]
+        categs = categ_model.create([{"name": "Categ 1"}, {"name": "Categ 2"}])
+        categs[1].active = False
+        title = self.env["res.partner.title"].create({"name": "Dr. Test"})
+        recs = [
+            {"_line_nr": 1, "name": "A", "title": "Dr. Test", "category_id": "Categ 1"},
+            {"_line_nr": 2, "name": "B", "title": "Nope", "category_id": "Categ 2"},
+            {"_line_nr": 3, "name": "C", "title": "Dr. Test", "category_id": "Nope"},
+        ]
+        with mock.patch.object(
+            type(categ_model),
+            "search",
+            autospec=True,
+            side_effect=type(categ_model).search,
+        ) as mocked:
+            mapper.prefetch_relations(recs)
+            self.assertEqual(mocked.call_count, 1)
+            res = [mapper.dynamic_fields(rec) for rec in recs]
+            self.assertEqual(mocked.call_count, 1)
+        self.assertEqual(
+            res,
+            [
+                {
+                    "name": "A",
+                    "title": title.id,
+                    "category_id": [(6, 0, categs[0].ids)],
+                },
+                # inactive records are found too
+                {"name": "B", "title": None, "category_id": [(6, 0, categs[1].ids)]},
+                {"name": "C", "title": title.id, "category_id": None},
+            ],
+        )
+        # same result w/o prefetching
+        mapper = self._get_dynamyc_mapper()
+        self.assertEqual([mapper.dynamic_fields(rec) for rec in recs], res)
+
+    def test_dynamic_mapper_lookup_cache(self):
+        self.addCleanup(lookup_cache.clear)
+        lookup_cache.clear()
+        mapper = self._get_dynamyc_mapper(
+            options=dict(converter={"title": {"lookup_cache": True}})
+        )
+        title_model = self.env["res.partner.title"]
+        title = title_model.create({"name": "Dr. Test"})
+        rec = {"_line_nr": 1, "name": "A", "title": "Dr. Test"}
+        missing_rec = {"_line_nr": 2, "name": "B", "title": "Prof. Test"}
+        with mock.patch.object(
+            type(title_model),
+            "search",
+            autospec=True,
+            side_effect=type(title_model).search,
+        ) as mocked:
+            self.assertEqual(mapper.dynamic_fields(rec)["title"], title.id)
+            self.assertIsNone(mapper.dynamic_fields(missing_rec)["title"])
+            self.assertEqual(mocked.call_count, 2)
+            # values are cached once committed only
+            self.assertEqual(len(lookup_cache), 0)
+            self.env.cr.postcommit.run()
+            self.assertEqual(len(lookup_cache), 2)
+            self.assertEqual(mapper.dynamic_fields(rec)["title"], title.id)
+            self.assertIsNone(mapper.dynamic_fields(missing_rec)["title"])
+            self.assertEqual(mocked.call_count, 2)
+            # changes on the model invalidate the cache
+            other_title = title_model.create({"name": "Prof. Test"})
+            self.assertEqual(len(lookup_cache), 0)
+            self.assertEqual(
+                mapper.dynamic_fields(missing_rec)["title"], other_title.id
+            )
+            self.assertEqual(mocked.call_count, 3)
+
+    def test_dynamic_mapper_lookup_cache_savepoint(self):
+        self.addCleanup(lookup_cache.clear)
+        lookup_cache.clear()
+        mapper = self._get_dynamyc_mapper(
+            options=dict(converter={"title": {"lookup_cache": True}})
+        )
+        rec = {"_line_nr": 1, "name": "A", "title": "Dr. Test"}
+        # the title is created and found in a savepoint rolled back
+        with self.assertRaises(ValueError):
+            with pending_lookups_savepoint(self.env.cr), self.env.cr.savepoint():
+                title = self.env["res.partner.title"].create({"name": "Dr. Test"})
+                self.assertEqual(mapper.dynamic_fields(rec)["title"], title.id)
+                raise ValueError()
+        self.assertFalse(title.exists())
+        self.env.cr.postcommit.run()
+        self.assertEqual(len(lookup_cache), 0)
+        # nothing cached, nothing to invalidate
+        with mock.patch(
+            "odoo.addons.connector_importer.models.base.invalidate_lookups"
+        ) as mocked:
+            self.env["res.partner.title"].create({"name": "Prof. Test"})
+            mocked.assert_not_called()
+
+    def test_dynamic_mapper_plan_converters_options(self):
+        title_model = self.env["res.partner.title"]
+        doctor = title_model.create({"name": "Doctor X", "shortcut": "DrX"})
+        prof = title_model.create({"name": "Prof X", "shortcut": "PrX"})
+        categ = self.env["res.partner.category"].create({"name": "Categ X"})
+        self.env["ir.model.data"].create(
+            {
+                "module": "__import__",
+                "name": "categ_x",
+                "model": categ._name,
+                "res_id": categ.id,
+            }
+        )
+        converter = {
+            "title": {
+                "default_search_value": "DrX",
+                "default_search_field": "shortcut",
+            },
+            "parent_id": {"sanitize_default_mod_name": "base"},
+            "category_id": {"sanitize_default_mod_name": "__import__"},
+        }
+        mapper = self._get_dynamyc_mapper(options=dict(converter=converter))
+        recs = [
+            {
+                "_line_nr": 1,
+                "title": "",
+                "xid::parent_id": "res_partner_10",
+                "xid::category_id": "categ_x",
+            },
+            {
+                "_line_nr": 2,
+                "title": "Prof X",
+                "xid::parent_id": "res_partner_10",
+                "xid::category_id": "categ_x",
+            },
+        ]
+        res = [mapper.dynamic_fields(rec) for rec in recs]
+        parent = self.env.ref("base.res_partner_10")
+        self.assertEqual(
+            res,
+            [
+                {
+                    "title": doctor.id,
+                    "parent_id": parent.id,
+                    "category_id": [(6, 0, categ.ids)],
+                },
+                {
+                    "title": prof.id,
+                    "parent_id": parent.id,
+                    "category_id": [(6, 0, categ.ids)],
+                },
+            ],
+        )
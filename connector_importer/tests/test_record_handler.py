@@ -2,8 +2,11 @@
 # Copyright 2023 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
+from unittest import mock
+
 from odoo.tools import DotDict
 
+from ..utils.misc import XMLIDResolver
 from .common import TestImporterBase
 
 values = {
@@ -71,3 +74,74 @@ class TestRecordImporter(TestImporterBase):
         self.assertEqual(
             domain, [("name", "=", values["name"]), ("age", "=", values["age"])]
         )
+
+    def test_update_translations_multi(self):
+        self.env["res.lang"]._activate_lang("fr_FR")
+        handler = self._get_handler()
+        categs = self.env["res.partner.category"].create(
+            [{"name": "Red"}, {"name": "Light red"}, {"name": "Blue"}]
+        )
+        categs[2].with_context(lang="fr_FR").name = "Bleu"
+        items = [
+            (categs[0], {"fr_FR": {"name": "Rouge"}}),
+            (categs[1], {"fr_FR": {"name": "Rouge"}}),
+            # already translated
+            (categs[2], {"fr_FR": {"name": "Bleu"}}),
+        ]
+        categ_cls = type(categs)
+        with mock.patch.object(
+            type(handler), "write_context", return_value={}
+        ), mock.patch.object(
+            categ_cls, "write", autospec=True, side_effect=categ_cls.write
+        ) as mocked:
+            handler.update_translations_multi(items)
+        self.assertEqual(mocked.call_count, 1)
+        self.assertEqual(mocked.call_args.args[0], categs[:2])
+        self.assertEqual(
+            categs.with_context(lang="fr_FR").mapped("name"), ["Rouge", "Rouge", "Bleu"]
+        )
+        self.assertEqual(categs.mapped("name"), ["Red", "Light red", "Blue"])
+
+    def test_xmlid_resolver(self):
+        resolver = XMLIDResolver(self.env)
+        resolver.prefetch(["base.main_company", "__import__.categ_new"])
+        model_data_cls = type(self.env["ir.model.data"])
+        with mock.patch.object(
+            model_data_cls,
+            "_xmlid_to_res_model_res_id",
+            autospec=True,
+            side_effect=model_data_cls._xmlid_to_res_model_res_id,
+        ) as mocked:
+            self.assertEqual(
+                resolver.ref("base.main_company"), self.env.ref("base.main_company")
+            )
+            self.assertIsNone(resolver.ref("__import__.categ_new"))
+            self.assertEqual(mocked.call_count, 0)
+            # created by someone else in the meantime
+            categ = self.env["res.partner.category"].create({"name": "New"})
+            self.env["ir.model.data"].create(
+                {
+                    "module": "__import__",
+                    "name": "categ_new",
+                    "model": categ._name,
+                    "res_id": categ.id,
+                }
+            )
+            self.assertEqual(resolver.ref("__import__.categ_new"), categ)
+            self.assertEqual(mocked.call_count, 1)
+
+    def test_bulk_create_disabled_by_overrides(self):
+        handler = self._get_handler()
+        self.assertFalse(handler.must_bulk_create)
+        handler.work.options["record_handler"] = {"bulk_create": True}
+        self.assertTrue(handler.must_bulk_create)
+        # `odoo_create_multi` would bypass the override
+        with mock.patch.object(type(handler), "odoo_create", autospec=True):
+            self.assertFalse(handler.must_bulk_create)
+
+    def test_bulk_write_disabled_by_overrides(self):
+        handler = self._get_handler()
+        handler.work.options["record_handler"] = {"bulk_write": True}
+        self.assertTrue(handler.must_bulk_write)
+        with mock.patch.object(type(handler), "odoo_write", autospec=True):
+            self.assertFalse(handler.must_bulk_write)
@@ -2,12 +2,15 @@
 # Copyright 2018 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
+from unittest import mock
+
 from odoo.tools import mute_logger
 
 from .common import TestImporterBase
 
 MOD_PATH = "odoo.addons.connector_importer"
 RECORD_MODEL = MOD_PATH + ".models.record.ImportRecord"
+HANDLER_CLASS = MOD_PATH + ".components.odoorecord.OdooRecordHandler"
 LOGGERS_TO_MUTE = (
     "[importer]",
     "odoo.addons.queue_job.utils",
@@ -134,3 +137,237 @@ class TestRecordImporter(TestImporterBase):
             self.assertEqual(len(report[model][k]), v)
         skipped_msg1 = report[model]["skipped"][0]["message"]
         self.assertEqual(skipped_msg1, "ALREADY EXISTS: ref=id_1")
+
+    @mute_logger(*LOGGERS_TO_MUTE)
+    def test_importer_lookup_once_per_line(self):
+        lines = self._fake_lines(10, keys=("id", "fullname"))
+        self.record.set_data(lines)
+        self.record.run_import()
+        self.recordset.set_report({}, reset=True)
+        model = "res.partner"
+        partner_cls = type(self.env[model])
+        with mock.patch.object(
+            partner_cls, "search", autospec=True, side_effect=partner_cls.search
+        ) as mocked:
+            res = self.record.run_import()
+        expected = {"created": 0, "errored": 0, "updated": 10, "skipped": 0}
+        self.assertEqual(res[model], expected)
+        # skip_it, run and odoo_write share the same lookup
+        lookups = [x for x in mocked.call_args_list if "ref" in str(x.args[1])]
+        self.assertEqual(len(lookups), 10)
+
+    @mute_logger(*LOGGERS_TO_MUTE)
+    def test_importer_prefetch_existing(self):
+        self.import_type.options = """
+- model: res.partner
+  importer:
+    name: fake.partner.importer
+  options:
+    importer:
+      prefetch_existing: true
+"""
+        lines = self._fake_lines(10, keys=("id", "fullname"))
+        # make the last line a duplicate of the 1st one
+        lines[-1]["id"] = lines[0]["id"]
+        self.record.set_data(lines)
+        model = "res.partner"
+        partner_cls = type(self.env[model])
+        with mock.patch.object(
+            partner_cls, "search", autospec=True, side_effect=partner_cls.search
+        ) as mocked:
+            res = self.record.run_import()
+        # the duplicate is found once created
+        expected = {"created": 9, "errored": 0, "updated": 1, "skipped": 0}
+        self.assertEqual(res[model], expected)
+        lookups = [x for x in mocked.call_args_list if "ref" in str(x.args[1])]
+        self.assertEqual(len(lookups), 1)
+        self.assertEqual(self.env[model].search_count([("ref", "like", "id_%")]), 9)
+        # run it again: all the lines are updated
+        self.recordset.set_report({}, reset=True)
+        res = self.record.run_import()
+        expected = {"created": 0, "errored": 0, "updated": 10, "skipped": 0}
+        self.assertEqual(res[model], expected)
+
+    @mute_logger(*LOGGERS_TO_MUTE)
+    def test_importer_bulk_create(self):
+        self.import_type.options = """
+- model: res.partner
+  importer:
+    name: fake.partner.importer
+  options:
+    record_handler:
+      bulk_create: true
+"""
+        lines = self._fake_lines(10, keys=("id", "fullname"))
+        # make the last line a duplicate of the 1st one
+        lines[-1]["id"] = lines[0]["id"]
+        self.record.set_data(lines)
+        model = "res.partner"
+
+        def pre_create(handler, values, orig_values):
+            values["name"] += " (imported)"
+
+        def post_create(handler, odoo_record, values, orig_values):
+            if values["ref"] == "id_3":
+                raise ValueError("Broken")
+
+        with mock.patch(
+            HANDLER_CLASS + ".odoo_pre_create", autospec=True, side_effect=pre_create
+        ), mock.patch(
+            HANDLER_CLASS + ".odoo_post_create", autospec=True, side_effect=post_create
+        ) as mocked:
+            res = self.record.run_import()
+        # the batch of 9 lines (flushed by the duplicate) fails at the 3rd one,
+        # then lines are created one by one
+        self.assertEqual(mocked.call_count, 3 + 9)
+        # hooks of the failed batch do not leak into the fallback
+        partners = self.env[model].search([("ref", "like", "id_%")])
+        self.assertFalse(any(x.name.count("(imported)") > 1 for x in partners))
+        expected = {"created": 8, "errored": 1, "updated": 1, "skipped": 0}
+        self.assertEqual(res[model], expected)
+        report = self.recordset.get_report()
+        self.assertEqual(report[model]["errored"][0]["line_nr"], 3)
+        self.assertEqual(report[model]["errored"][0]["message"], "Broken")
+        self.assertEqual(self.env[model].search_count([("ref", "like", "id_%")]), 8)
+
+    @mute_logger(*LOGGERS_TO_MUTE)
+    def test_importer_bulk_write(self):
+        lines = self._fake_lines(10, keys=("id", "fullname"))
+        self.record.set_data(lines)
+        self.record.run_import()
+        self.recordset.set_report({}, reset=True)
+        self.import_type.options = """
+- model: res.partner
+  importer:
+    name: fake.partner.importer
+  options:
+    record_handler:
+      bulk_write: true
+"""
+        # 2 groups of identical values
+        for i, line in enumerate(lines):
+            line["fullname"] = "Even" if i % 2 else "Odd"
+        self.record.set_data(lines)
+        model = "res.partner"
+        partner_cls = type(self.env[model])
+        with mock.patch.object(
+            partner_cls, "write", autospec=True, side_effect=partner_cls.write
+        ) as mocked:
+            res = self.record.run_import()
+        expected = {"created": 0, "errored": 0, "updated": 10, "skipped": 0}
+        self.assertEqual(res[model], expected)
+        writes = [x for x in mocked.call_args_list if "name" in x.args[1]]
+        self.assertEqual(len(writes), 2)
+        partners = self.env[model].search([("ref", "like", "id_%")])
+        self.assertEqual(len(partners.filtered(lambda x: x.name == "Odd")), 5)
+        self.assertEqual(len(partners.filtered(lambda x: x.name == "Even")), 5)
+        report = self.recordset.get_report()
+        self.assertEqual(
+            [x["line_nr"] for x in report[model]["updated"]], list(range(1, 11))
+        )
+
+    @mute_logger(*LOGGERS_TO_MUTE)
+    def test_importer_savepoint_batch(self):
+        self.import_type.options = """
+- model: res.partner
+  importer:
+    name: fake.partner.importer
+  options:
+    importer:
+      savepoint_batch_size: 4
+"""
+        lines = self._fake_lines(10, keys=("id", "fullname"))
+        self.record.set_data(lines)
+        model = "res.partner"
+
+        def post_create(handler, odoo_record, values, orig_values):
+            if values["ref"] == "id_3":
+                raise ValueError("Broken")
+
+        with mock.patch(
+            HANDLER_CLASS + ".odoo_post_create", autospec=True, side_effect=post_create
+        ):
+            res = self.record.run_import()
+        expected = {"created": 9, "errored": 1, "updated": 0, "skipped": 0}
+        self.assertEqual(res[model], expected)
+        report = self.recordset.get_report()
+        # lines of the failed batch are tracked once
+        self.assertEqual(
+            sorted(x["line_nr"] for x in report[model]["created"]),
+            [1, 2, 4, 5, 6, 7, 8, 9, 10],
+        )
+        self.assertEqual(report[model]["errored"][0]["line_nr"], 3)
+        self.assertEqual(report[model]["errored"][0]["message"], "Broken")
+        self.assertEqual(self.env[model].search_count([("ref", "like", "id_%")]), 9)
+
+    @mute_logger(*LOGGERS_TO_MUTE)
+    def test_importer_bulk_translations_errors(self):
+        self.import_type.options = """
+- model: res.partner
+  importer:
+    name: fake.partner.importer
+  options:
+    record_handler:
+      bulk_translations: true
+"""
+        lines = self._fake_lines(10, keys=("id", "fullname"))
+        self.record.set_data(lines)
+        model = "res.partner"
+
+        def update_translations(handler, odoo_record, translatable, ctx=None):
+            if odoo_record.ref == "id_3":
+                raise ValueError("Broken")
+
+        with mock.patch(
+            MOD_PATH + ".components.importer.RecordImporter.collect_translatable",
+            return_value={"fr_FR": {"name": "Nom"}},
+        ), mock.patch(
+            HANDLER_CLASS + ".update_translations_multi",
+            side_effect=ValueError("Bulk broken"),
+        ), mock.patch(
+            HANDLER_CLASS + ".update_translations",
+            autospec=True,
+            side_effect=update_translations,
+        ):
+            res = self.record.run_import()
+        # the line is not counted as created too
+        expected = {"created": 9, "errored": 1, "updated": 0, "skipped": 0}
+        self.assertEqual(res[model], expected)
+        report = self.recordset.get_report()
+        self.assertNotIn(3, [x["line_nr"] for x in report[model]["created"]])
+        self.assertEqual(report[model]["errored"][0]["line_nr"], 3)
+        self.assertEqual(report[model]["errored"][0]["message"], "Broken")
+
+    @mute_logger(*LOGGERS_TO_MUTE)
+    def test_importer_skip_fields_unchanged(self):
+        lines = self._fake_lines(10, keys=("id", "fullname"))
+        self.record.set_data(lines)
+        self.record.run_import()
+        self.recordset.set_report({}, reset=True)
+        self.import_type.options = """
+- model: res.partner
+  importer:
+    name: fake.partner.importer
+  options:
+    record_handler:
+      bulk_write: true
+      skip_fields_unchanged: true
+"""
+        lines[3]["fullname"] = "Changed"
+        self.record.set_data(lines)
+        model = "res.partner"
+        partner_cls = type(self.env[model])
+        with mock.patch.object(
+            partner_cls, "write", autospec=True, side_effect=partner_cls.write
+        ) as mock_write, mock.patch.object(
+            partner_cls, "read", autospec=True, side_effect=partner_cls.read
+        ) as mock_read:
+            res = self.record.run_import()
+        expected = {"created": 0, "errored": 0, "updated": 10, "skipped": 0}
+        self.assertEqual(res[model], expected)
+        # current values are read at once, only the changed record is written
+        reads = [x for x in mock_read.call_args_list if "name" in x.args[1]]
+        self.assertEqual(len(reads), 1)
+        self.assertEqual(len(reads[0].args[0]), 10)
+        self.assertEqual(mock_write.call_count, 1)
+        self.assertEqual(mock_write.call_args.args[1], {"name": "Changed"})
@@ -2,6 +2,8 @@
 # Copyright 2018 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
+from unittest import mock
+
 from odoo.tools import DotDict, mute_logger
 
 from .common import TestImporterBase
@@ -39,6 +41,39 @@ class TestRecordImporter(TestImporterBase):
         required = importer.required_keys()
         self.assertDictEqual(required, {"fullname": ("name",), "id": ("ref",)})
 
+    @mute_logger("[importer]")
+    def test_importer_compile_required_keys(self):
+        importer = self._get_importer()
+        self.assertEqual(
+            importer._compile_required_keys(),
+            (("fullname", "name", True, True), ("id", "ref", True, True)),
+        )
+
+    @mute_logger("[importer]")
+    def test_importer_skip_it_custom_check_missing(self):
+        importer = self._get_importer()
+        # computed on demand, even w/out initializing the importer
+        self.assertEqual(
+            importer._get_required_spec(), importer._compile_required_keys()
+        )
+        importer._init_importer(self.recordset)
+        values = {"name": "", "ref": "doe"}
+        orig_values = {"fullname": "", "id": "#doe"}
+        # empty values are not missing by default
+        self.assertFalse(importer.skip_it(values, orig_values))
+
+        def check_missing(importer, source_key, dest_key, values, orig_values):
+            if not orig_values.get(source_key):
+                return {"message": "EMPTY {}".format(source_key)}
+            return False
+
+        with mock.patch.object(
+            type(importer), "_check_missing", autospec=True, side_effect=check_missing
+        ):
+            self.assertEqual(
+                importer.skip_it(values, orig_values), {"message": "EMPTY fullname"}
+            )
+
     @mute_logger("[importer]")
     def test_importer_check_missing_none(self):
         importer = self._get_importer()
@@ -106,6 +141,16 @@ class TestRecordImporter(TestImporterBase):
         mapper = importer._get_mapper()
         self.assertEqual(mapper._name, "fake.partner.mapper")
 
+    def test_importer_find_existing_before_mapping(self):
+        importer = self._get_importer()
+        # `ref` is mapped from `id`: source values cannot be used
+        self.assertFalse(importer.mapper.maps_key_as_is("ref"))
+        self.assertFalse(importer._can_find_existing_before_mapping())
+        self.assertFalse(importer.mapper.maps_key_as_is("name"))
+        importer.work.options["mapper"] = {"name": "importer.mapper.dynamic"}
+        importer._mapper = None
+        self.assertTrue(importer._can_find_existing_before_mapping())
+
     def test_importer_context(self):
         importer = self._get_importer(
             options={"importer": {"ctx": {"key1": 1, "key2": 2}}, "mapper": {}}
@@ -120,3 +165,26 @@ class TestRecordImporter(TestImporterBase):
                 "key2": 2,
             },
         )
+
+    @mute_logger("[importer]")
+    def test_importer_collect_translatable(self):
+        importer = self._get_importer()
+        importer_cls = type(importer)
+        values = {"name": "Name", "ref": "doe"}
+        orig_values = {"fullname": "Name", "name:fr": "Nom", "name:it": "Nome"}
+        with mock.patch.object(
+            importer_cls, "translatable_keys", return_value=("name",)
+        ) as keys, mock.patch.object(
+            importer_cls, "translatable_langs", return_value=["fr_FR", "de_DE"]
+        ) as langs:
+            for __ in range(3):
+                self.assertEqual(
+                    importer.collect_translatable(values, orig_values),
+                    {"fr_FR": {"name": "Nom"}},
+                )
+            self.assertEqual(keys.call_count, 1)
+            self.assertEqual(langs.call_count, 1)
+        self.assertEqual(
+            importer._translation_map,
+            (("fr_FR", "name", "name:fr"), ("de_DE", "name", "name:de")),
+        )
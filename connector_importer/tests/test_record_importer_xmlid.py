@@ -2,8 +2,12 @@
 # Copyright 2018 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
+from unittest import mock
+
 from odoo.tools import mute_logger
 
+from odoo.addons.connector.components.mapper import Mapper
+
 from .common import TestImporterBase
 
 LOGGERS_TO_MUTE = (
@@ -62,3 +66,125 @@ class TestRecordImporterXMLID(TestImporterBase):
                 "__import__.id_{}".format(i), raise_if_not_found=False
             )
             self.assertTrue(partner)
+
+    @mute_logger(*LOGGERS_TO_MUTE)
+    def test_importer_skip_before_mapping(self):
+        self.import_type.write(
+            {
+                "options": """
+- model: res.partner
+  importer:
+    name:
+      fake.partner.importer.xmlid
+  options:
+    importer:
+      skip_before_mapping: true
+                """
+            }
+        )
+        lines = self._fake_lines(10, keys=("id", "fullname"))
+        lines[0].pop("fullname")
+        self.record.set_data(lines)
+        model = "res.partner"
+        with mock.patch.object(
+            Mapper, "map_record", autospec=True, side_effect=Mapper.map_record
+        ) as mocked:
+            res = self.record.run_import()
+        self.assertEqual(mocked.call_count, 9)
+        expected = {"created": 9, "errored": 0, "updated": 0, "skipped": 1}
+        self.assertEqual(res[model], expected)
+        report = self.recordset.get_report()
+        self.assertEqual(
+            report[model]["skipped"][0]["message"],
+            "MISSING REQUIRED SOURCE KEY=fullname",
+        )
+        # run it again w/out overriding existing records
+        self.recordset.set_report({}, reset=True)
+        self.recordset.override_existing = False
+        with mock.patch.object(
+            Mapper, "map_record", autospec=True, side_effect=Mapper.map_record
+        ) as mocked:
+            res = self.record.run_import()
+        self.assertEqual(mocked.call_count, 0)
+        expected = {"created": 0, "errored": 0, "updated": 0, "skipped": 10}
+        self.assertEqual(res[model], expected)
+        report = self.recordset.get_report()
+        skipped = report[model]["skipped"][1]
+        self.assertEqual(skipped["message"], "ALREADY EXISTS: id=__import__.id_2")
+        self.assertEqual(skipped["odoo_record"], self.env.ref("__import__.id_2").id)
+
+    @mute_logger(*LOGGERS_TO_MUTE)
+    def test_importer_prefetch_xmlids(self):
+        self.import_type.write(
+            {
+                "options": """
+- model: res.partner
+  importer:
+    name:
+      fake.partner.importer.xmlid
+  options:
+    importer:
+      prefetch_xmlids: true
+                """
+            }
+        )
+        lines = self._fake_lines(10, keys=("id", "fullname"))
+        self.record.set_data(lines)
+        model = "res.partner"
+        model_data_cls = type(self.env["ir.model.data"])
+        with mock.patch.object(
+            model_data_cls,
+            "_xmlid_to_res_model_res_id",
+            autospec=True,
+            side_effect=model_data_cls._xmlid_to_res_model_res_id,
+        ) as mocked:
+            res = self.record.run_import()
+            self.assertEqual(mocked.call_count, 0)
+            expected = {"created": 10, "errored": 0, "updated": 0, "skipped": 0}
+            self.assertEqual(res[model], expected)
+            # run it again to update the same records
+            self.recordset.set_report({}, reset=True)
+            res = self.record.run_import()
+            self.assertEqual(mocked.call_count, 0)
+        expected = {"created": 0, "errored": 0, "updated": 10, "skipped": 0}
+        self.assertEqual(res[model], expected)
+        self.assertEqual(self.env.ref("__import__.id_2").name, lines[1]["fullname"])
+
+    @mute_logger(*LOGGERS_TO_MUTE)
+    def test_importer_bulk_create_fallback_xmlids(self):
+        self.import_type.write(
+            {
+                "options": """
+- model: res.partner
+  importer:
+    name:
+      fake.partner.importer.xmlid
+  options:
+    importer:
+      prefetch_xmlids: true
+    record_handler:
+      bulk_create: true
+                """
+            }
+        )
+        lines = self._fake_lines(10, keys=("id", "fullname"))
+        self.record.set_data(lines)
+        model = "res.partner"
+        handler_cls = (
+            "odoo.addons.connector_importer.components.odoorecord.OdooRecordHandler"
+        )
+
+        def post_create(handler, odoo_record, values, orig_values):
+            if orig_values["id"] == "id_3":
+                raise ValueError("Broken")
+
+        with mock.patch(
+            handler_cls + ".odoo_post_create", autospec=True, side_effect=post_create
+        ):
+            res = self.record.run_import()
+        expected = {"created": 9, "errored": 1, "updated": 0, "skipped": 0}
+        self.assertEqual(res[model], expected)
+        # XML-IDs of records created by the failed batch are not trusted
+        for i in range(1, 11):
+            partner = self.env.ref("__import__.id_%d" % i, raise_if_not_found=False)
+            self.assertEqual(bool(partner), i != 3)
@@ -61,6 +61,145 @@ class TestRecordsetImporter(TestImporterBase):
         records = self.recordset.get_records()
         self.assertEqual(len(records), 5)
 
+    @mute_logger("[importer]")
+    @mock.patch("%s.run_import" % RECORD_MODEL)
+    def test_recordset_importer_batch(self, mocked_run_inport):
+        # generate 100 records
+        lines = self._fake_lines(100, keys=("id", "fullname"))
+        # source will provide 5x20 chunks, records created 2 by 2
+        self._patch_get_source(lines, chunk_size=20, fanout_batch_size=2)
+        with self.backend.work_on(
+            "import.recordset", components_registry=self.comp_registry
+        ) as work:
+            importer = work.component(usage="recordset.importer")
+            importer.run(self.recordset)
+        # debug mode: no job, records are imported one by one
+        self.assertEqual(mocked_run_inport.call_count, 5)
+        records = self.recordset.get_records()
+        self.assertEqual(len(records), 5)
+        for i, rec in enumerate(records):
+            self.assertEqual(rec.get_data(), lines[i * 20 : (i + 1) * 20])
+
+    @mute_logger("[importer]")
+    def test_record_run_import_batch(self):
+        self.backend.debug_mode = False
+        records = self.env["import.record"].create(
+            [{"recordset_id": self.recordset.id} for __ in range(3)]
+        )
+        records.run_import_batch()
+        self.assertEqual(len(records.job_id), 3)
+        for rec in records:
+            self.assertEqual(rec.job_id.state, "pending")
+            self.assertEqual(rec.job_id.method_name, "import_record")
+            self.assertEqual(rec.job_id.records, rec)
+
+    @mute_logger("[importer]")
+    def test_job_window(self):
+        self.backend.debug_mode = False
+        self.import_type.job_window_size = 2
+        # generate 120 records
+        lines = self._fake_lines(120, keys=("id", "fullname"))
+        # source will provide 6x20 chunks
+        self._patch_get_source(lines, chunk_size=20)
+        with self.backend.work_on(
+            "import.recordset", components_registry=self.comp_registry
+        ) as work:
+            importer = work.component(usage="recordset.importer")
+            importer.run(self.recordset)
+        records = self.recordset.get_records()
+        self.assertEqual(len(records), 6)
+        # only 2 jobs pending
+        self.assertEqual(
+            [bool(x.job_id) for x in records], [True, True, False, False, False, False]
+        )
+        self.assertEqual(records[0].job_id.import_recordset_id, self.recordset)
+        # still 2 pending: nothing to do
+        self.recordset.run_import_window()
+        self.assertFalse(records[2].job_id)
+        # 1st chunk done: next one is enqueued
+        job = Job.load(self.env, records[0].job_id.uuid)
+        job.set_done()
+        job.store()
+        self.assertTrue(records[2].job_id)
+        self.assertFalse(records[3].job_id)
+        # failed jobs free the window too
+        job = Job.load(self.env, records[1].job_id.uuid)
+        job.set_failed(exc_info="Boom")
+        job.store()
+        self.assertTrue(records[3].job_id)
+        self.assertFalse(records[4].job_id)
+        # as well as jobs done by hand
+        records[2].job_id.button_done()
+        self.assertTrue(records[4].job_id)
+        self.assertFalse(records[5].job_id)
+        # and deleted ones
+        records[3].job_id.unlink()
+        self.assertTrue(records[5].job_id)
+
+    @mute_logger("[importer]")
+    def test_job_window_many_importers(self):
+        self.backend.debug_mode = False
+        self.import_type.job_window_size = 3
+        self.import_type.options = """
+- model: res.partner
+  importer:
+    name: fake.partner.importer
+- model: res.partner
+  importer:
+    name: fake.partner.importer
+"""
+        records = self.env["import.record"].create(
+            [{"recordset_id": self.recordset.id} for __ in range(3)]
+        )
+        self.recordset.run_import_window()
+        # 2 jobs per record, only the last one is linked to it
+        jobs = self.env["queue.job"].search(
+            [("import_recordset_id", "=", self.recordset.id)]
+        )
+        self.assertEqual(len(jobs), 2)
+        self.assertEqual([bool(x.job_id) for x in records], [True, False, False])
+        # the 1st job of the record is done: 1 job pending, room for 1 record
+        (jobs - records[0].job_id).button_done()
+        self.assertEqual([bool(x.job_id) for x in records], [True, True, False])
+
+    @mute_logger("[importer]")
+    def test_job_window_interleaved_producers(self):
+        self.backend.debug_mode = False
+        self.import_type.job_window_size = 10
+        other_recordset = self.recordset.copy()
+        record_model = self.env["import.record"]
+        # 2 range jobs create records at the same time:
+        # records of the 2nd one are not visible until it commits.
+        records_1 = record_model.browse()
+        records_2 = record_model.browse()
+        for __ in range(2):
+            records_1 |= record_model.create({"recordset_id": self.recordset.id})
+            records_2 |= record_model.create({"recordset_id": other_recordset.id})
+        # the 1st job is done
+        self.recordset.run_import_window()
+        self.assertTrue(all(records_1.mapped("job_id")))
+        # the 2nd job is done: its records are enqueued despite their lower ids
+        records_2.write({"recordset_id": self.recordset.id})
+        self.assertTrue(records_2[0].id < records_1[1].id)
+        self.recordset.run_import_window()
+        self.assertTrue(all(records_2.mapped("job_id")))
+
+    @mute_logger("[importer]")
+    def test_record_data_codec(self):
+        lines = self._fake_lines(10, keys=("id", "fullname"))
+        # sparse line
+        lines[3].pop("fullname")
+        record = self.env["import.record"].create({"recordset_id": self.recordset.id})
+        for codec in ("json", "columnar", "zlib"):
+            record.set_data(lines, codec=codec)
+            self.assertEqual(record.get_data(), lines)
+        payload = record._get_data_attachment().raw
+        self.assertTrue(payload.startswith(b"\x00CHUNK:zlib\n"))
+        # legacy payloads are still readable
+        record.set_data(lines)
+        self.assertEqual(record._get_data_attachment().raw[:1], b"[")
+        self.assertEqual(record.get_data(), lines)
+
     @mute_logger("[importer]")
     def test_job_state(self):
         self.backend.debug_mode = False
@@ -3,6 +3,7 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
 import base64
+from unittest import mock
 
 from odoo_test_helper import FakeModelLoader
 
@@ -10,6 +11,8 @@ from odoo.tools import mute_logger
 
 from .common import BaseTestCase
 
+MOD_PATH = "odoo.addons.connector_importer.models.sources.source_csv"
+
 
 class TestSourceCSV(BaseTestCase):
     @classmethod
@@ -85,6 +88,125 @@ class TestSourceCSV(BaseTestCase):
             lines[4], {"id": "5", "fullname": "George McFly", "_line_nr": 6}
         )
 
+    def test_source_get_lines_sorted(self):
+        source = self.source
+        # small buffer to force spilling runs to temporary files
+        source.write({"sort_keys": "fullname", "sort_buffer_size": 2})
+        self.assertFalse(source.can_chunk_by_ref())
+        lines = [x for chunk in source.get_lines() for x in chunk]
+        self.assertEqual(
+            [x["fullname"] for x in lines],
+            [
+                "Biff Tannen",
+                "Clara Clayton",
+                "Emmet Brown",
+                "George McFly",
+                "Marty McFly",
+            ],
+        )
+        self.assertEqual([x["_line_nr"] for x in lines], [3, 5, 4, 6, 2])
+
+    @mute_logger("[importer]")
+    def test_source_get_lines_stream(self):
+        source = self.source
+        expected = list(source._get_lines())
+        source.csv_stream = True
+        lines = list(source._get_lines())
+        self.assertEqual(lines, expected)
+        source.csv_rows_from_to = "1:3"
+        lines = list(source._get_lines())
+        self.assertEqual(
+            lines,
+            [
+                {"id": "2", "fullname": "Biff Tannen", "_line_nr": 2},
+                {"id": "3", "fullname": "Emmet Brown", "_line_nr": 3},
+            ],
+        )
+
+    @mute_logger("[importer]")
+    def test_source_encoding_cache(self):
+        source = self.source
+        self.assertFalse(source.csv_encoding_detected)
+        self.assertEqual(source._get_csv_encoding(), "ascii")
+        self.assertEqual(source.csv_encoding_detected, "ascii")
+        self.assertEqual(source.csv_checksum, source._get_csv_attachment().checksum)
+        with mock.patch(MOD_PATH + ".get_encoding") as mocked:
+            self.assertEqual(source._get_csv_encoding(), "ascii")
+            list(source._get_lines())
+            mocked.assert_not_called()
+        # explicit encoding wins
+        source.csv_encoding = "utf-8"
+        self.assertEqual(source._get_csv_encoding(), "utf-8")
+
+    @mute_logger("[importer]")
+    def test_source_encoding_sample(self):
+        source = self.source
+        source.csv_encoding_sample_kb = 1
+        # the file is plain ascii but unsampled bytes could be anything
+        self.assertEqual(source._get_csv_encoding(), "utf-8")
+        self.assertEqual(len(list(source._get_lines())), 5)
+
+    @mute_logger("[importer]")
+    def test_source_get_lines_stream_encoding_fallback(self):
+        # non ascii bytes far from the sampled parts of the file
+        filecontent = b"id;fullname\n"
+        filecontent += b"".join(b"%d;Name %d\n" % (i, i) for i in range(10000))
+        filecontent += "10000;Jos\xe9\n".encode("latin-1")
+        source = self.env["import.source.csv"].create(
+            {
+                "csv_file": base64.encodebytes(filecontent),
+                "csv_delimiter": ";",
+                "csv_stream": True,
+                "csv_encoding_sample_kb": 1,
+            }
+        )
+        lines = list(source._get_lines())
+        self.assertEqual(len(lines), 10001)
+        self.assertEqual(lines[-1]["fullname"], "Jos\xe9")
+        source.csv_stream = False
+        self.assertEqual(list(source._get_lines()), lines)
+
+    @mute_logger("[importer]")
+    def test_source_chunk_refs(self):
+        source = self.source
+        self.assertFalse(source.can_chunk_by_ref())
+        source.write({"csv_chunk_by_ref": True, "chunk_size": 2})
+        self.assertTrue(source.can_chunk_by_ref())
+        refs = list(source.get_chunk_refs())
+        self.assertEqual(len(refs), 3)
+        self.assertEqual([x["line_nr"] for x in refs], [2, 4, 6])
+        lines = []
+        for ref in refs:
+            lines.extend(source.read_chunk_ref(ref))
+        self.assertEqual(lines, list(source._get_lines()))
+
+    def test_source_chunk_max_bytes(self):
+        source = self.source
+        source.write({"chunk_size": 10, "chunk_max_bytes": 1})
+        expected = list(source._get_lines())
+        chunks = list(source.get_lines())
+        # each line exceeds the limit: one line per chunk
+        self.assertEqual(chunks, [[x] for x in expected])
+        source.csv_chunk_by_ref = True
+        refs = list(source.get_chunk_refs())
+        self.assertEqual(len(refs), len(expected))
+
+    @mute_logger("[importer]")
+    def test_source_chunk_ranges(self):
+        source = self.source
+        source.write({"csv_chunk_by_ref": True, "chunk_size": 2})
+        self.assertEqual(source.get_chunk_ranges(), [])
+        source.csv_parallel_ranges = 2
+        ranges = source.get_chunk_ranges()
+        self.assertEqual(len(ranges), 2)
+        self.assertEqual(ranges[0]["line_nr"], 2)
+        self.assertEqual(ranges[0]["end"], ranges[1]["start"])
+        lines = []
+        for chunk_range in ranges:
+            for ref in source.get_chunk_refs(chunk_range=chunk_range):
+                lines.extend(source.read_chunk_ref(ref))
+        self.assertEqual(lines, list(source._get_lines()))
+
     def test_source_summary_data(self):
         source = self.source
         data = source._config_summary_data()
@@ -0,0 +1,129 @@
+# Author: Simone Orsi
+# Copyright 2024 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+"""Codecs to serialize chunks of lines stored on import records.
+
+Legacy payloads are plain JSON lists of dicts.
+Encoded payloads start w/ `MAGIC` followed by the codec name and a new line.
+"""
+
+import json
+import logging
+import zlib
+
+_logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+    _logger.debug("`zstandard` lib is missing")
+
+MAGIC = b"\x00CHUNK:"
+
+CODECS = {}
+
+
+def register_codec(klass):
+    """Register a codec class by its name."""
+    CODECS[klass.name] = klass()
+    return klass
+
+
+def to_columnar(lines):
+    """Convert a list of dicts to a header-once layout.
+
+    Return a dict like:
+
+        {
+            "headers": [["id", "name"], ["id"]],
+            "rows": [[0, "1", "John"], [1, "2"]],
+        }
+
+    whereas the 1st item of each row is the index of its header.
+    Lines w/ different keys (eg: sparse sources) get their own header.
+    """
+    headers = []
+    header_idx = {}
+    rows = []
+    for line in lines:
+        keys = tuple(line.keys())
+        idx = header_idx.get(keys)
+        if idx is None:
+            idx = header_idx[keys] = len(headers)
+            headers.append(keys)
+        rows.append([idx] + list(line.values()))
+    return {"headers": headers, "rows": rows}
+
+
+def from_columnar(data):
+    """Convert back a header-once layout to a list of dicts."""
+    headers = data["headers"]
+    return [dict(zip(headers[row[0]], row[1:])) for row in data["rows"]]
+
+
+@register_codec
+class ColumnarChunkCodec(object):
+    """Columnar layout serialized as compact JSON, no compression."""
+
+    name = "columnar"
+
+    def encode(self, lines):
+        data = json.dumps(to_columnar(lines), separators=(",", ":"))
+        return self.compress(data.encode("utf-8"))
+
+    def decode(self, payload):
+        return from_columnar(json.loads(self.decompress(payload)))
+
+    def compress(self, data):
+        return data
+
+    def decompress(self, data):
+        return data
+
+
+@register_codec
+class ZlibChunkCodec(ColumnarChunkCodec):
+    """Columnar layout compressed w/ zlib."""
+
+    name = "zlib"
+    level = 6
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+@register_codec
+class ZstdChunkCodec(ColumnarChunkCodec):
+    """Columnar layout compressed w/ zstd (requires `zstandard`)."""
+
+    name = "zstd"
+    level = 3
+
+    def compress(self, data):
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def decompress(self, data):
+        return zstandard.ZstdDecompressor().decompress(data)
+
+
+def available_codecs():
+    """Return names of codecs that can be used in the current environment."""
+    return [name for name in CODECS if name != "zstd" or zstandard is not None]
+
+
+def encode_chunk(lines, codec):
+    """Encode lines w/ given codec name."""
+    return MAGIC + codec.encode("ascii") + b"\n" + CODECS[codec].encode(lines)
+
+
+def decode_chunk(payload):
+    """Decode lines from encoded or legacy JSON payloads."""
+    if not payload.startswith(MAGIC):
+        return json.loads(payload.decode("utf-8"))
+    codec, body = payload[len(MAGIC) :].split(b"\n", 1)
+    return CODECS[codec.decode("ascii")].decode(body)
@@ -2,8 +2,13 @@
 # Copyright 2018 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
+import codecs
 import csv
+import heapq
 import io
+import itertools
+import pickle
+import tempfile
 import time
 
 from ..log import logger
@@ -17,17 +22,54 @@ except ImportError:
     _logger.debug("`chardet` lib is missing")
 
 
-def get_encoding(data):
+# Max bytes read at once when streaming CSV files
+STREAM_CHUNK_SIZE = 1024 * 64
+# Lines kept in memory by default when sorting lines externally
+SORT_BUFFER_SIZE = 10000
+# Encoding detection on samples: head size, number and size of extra probes
+ENCODING_SAMPLE_SIZE = 1024 * 64
+ENCODING_SAMPLE_PROBES = 4
+ENCODING_PROBE_SIZE = 1024 * 8
+# Error handler decoding bytes not matching the encoding as latin-1
+LATIN1_FALLBACK_ERRORS = "connector_importer.latin1_fallback"
+
+
+def _latin1_fallback(exc):
+    """Decode bytes not matching the expected encoding as latin-1.
+
+    The encoding might be guessed from a sample only: keep valid chars
+    and do not fail on few unexpected bytes. When streaming, we could not
+    retry w/ another encoding anyway as lines are already consumed.
+    """
+    if not isinstance(exc, UnicodeDecodeError):
+        raise exc
+    return exc.object[exc.start : exc.end].decode("latin-1"), exc.end
+
+
+codecs.register_error(LATIN1_FALLBACK_ERRORS, _latin1_fallback)
+
+
+def get_encoding(data, sample_size=None, probes=ENCODING_SAMPLE_PROBES):
     """Try to get encoding incrementally.
 
     See http://chardet.readthedocs.org/en/latest/usage.html#example-detecting-encoding-incrementally  # noqa
+
+    :param data: file content as bytes or a seekable binary file object
+    :param sample_size: if given, feed the detector only w/ the first
+        `sample_size` bytes plus `probes` evenly spaced samples of the file,
+        instead of the whole file.
+        As bytes out of the samples are unknown, `ascii` is reported as `utf-8`.
     """
     start = time.time()
     msg = "detecting file encoding..."
     logger.info(msg)
-    file_like = io.BytesIO(data)
+    file_like = data if hasattr(data, "read") else io.BytesIO(data)
     detector = UniversalDetector()
-    for _i, line in enumerate(file_like):
+    if sample_size:
+        lines = _iter_sample_lines(file_like, sample_size, probes)
+    else:
+        lines = file_like
+    for _i, line in enumerate(lines):
         detector.feed(line)
         if detector.done:
             break
@@ -35,7 +77,25 @@ def get_encoding(data):
     msg = "encoding found in %s sec" % str(time.time() - start)
     msg += str(detector.result)
     logger.info(msg)
-    return detector.result
+    result = detector.result
+    if sample_size and result.get("encoding") == "ascii":
+        result = dict(result, encoding="utf-8")
+    return result
+
+
+def _iter_sample_lines(file_like, sample_size, probes):
+    """Yield lines from the head of the file and from evenly spaced probes."""
+    yield from io.BytesIO(file_like.read(sample_size))
+    size = file_like.seek(0, io.SEEK_END)
+    for i in range(1, probes + 1):
+        offset = size * i // (probes + 1)
+        if offset <= sample_size:
+            continue
+        file_like.seek(offset)
+        # drop the 1st line as it's likely truncated
+        # (and it could break multi-byte characters)
+        file_like.readline()
+        yield from io.BytesIO(file_like.read(ENCODING_PROBE_SIZE))
 
 
 def csv_content_to_file(data, encoding=None):
@@ -44,10 +104,13 @@ def csv_content_to_file(data, encoding=None):
     if not encoding:
         encoding_info = get_encoding(data)
         encoding = encoding_info["encoding"]
-    if encoding is None or encoding != "utf-8":
-        try:
-            data_str = data.decode(encoding)
-        except (UnicodeDecodeError, TypeError):
+    try:
+        data_str = data.decode(encoding)
+    except (UnicodeDecodeError, TypeError, LookupError):
+        if is_ascii_compatible(encoding):
+            # likely few unexpected bytes (eg: encoding guessed from a sample)
+            data_str = data.decode(encoding, errors=LATIN1_FALLBACK_ERRORS)
+        else:
             # dirty fallback in case
             # we don't spot the right encoding above
             for enc in ("utf-16le", "latin-1", "ascii"):
@@ -56,17 +119,21 @@ def csv_content_to_file(data, encoding=None):
                     break
                 except UnicodeDecodeError:
                     data_str = data
-        data_str = data_str.encode("utf-8")
     else:
-        data_str = data
+        if encoding == "utf-8":
+            return data
+    if isinstance(data_str, str):
+        data_str = data_str.encode("utf-8")
     return data_str
 
 
-def guess_csv_metadata(filecontent):
+def guess_csv_metadata(filecontent, encoding=None):
     # we don't care about acuracy but we don't to get an unicode error
     # when converting to str
-    encoding = get_encoding(filecontent)
-    with io.StringIO(str(filecontent, encoding["encoding"])) as ff:
+    sample = filecontent[:ENCODING_SAMPLE_SIZE]
+    if not encoding:
+        encoding = get_encoding(sample)["encoding"] or "utf-8"
+    with io.StringIO(str(sample, encoding, errors="replace")) as ff:
         try:
             dialect = csv.Sniffer().sniff(ff.readline(), "\t,;")
             ff.seek(0)
@@ -82,7 +149,13 @@ def read_path(path):
 
 
 class CSVReader(object):
-    """Advanced CSV reader."""
+    """Advanced CSV reader.
+
+    By default the whole file is loaded and converted to UTF-8 in memory.
+    Pass `stream=True` to read it lazily instead:
+    the file is decoded incrementally and lines are parsed as they come,
+    hence memory usage stays bounded by `stream_chunk_size`.
+    """
 
     def __init__(
         self,
@@ -93,12 +166,21 @@ class CSVReader(object):
         encoding=None,
         fieldnames=None,
         rows_from_to=None,
+        stream=False,
+        stream_chunk_size=STREAM_CHUNK_SIZE,
     ):
         assert filedata or filepath, "Provide a file path or some file data!"
-        if filepath:
-            filedata = read_path(filepath)
-        self.bdata = csv_content_to_file(filedata, encoding)
-        self.data = str(self.bdata, "utf-8")
+        self.filepath = filepath
+        self.stream = stream
+        self.stream_chunk_size = stream_chunk_size
+        if stream:
+            self.bdata = filedata
+            self.data = None
+        else:
+            if filepath:
+                filedata = read_path(filepath)
+            self.bdata = csv_content_to_file(filedata, encoding)
+            self.data = str(self.bdata, "utf-8")
         self.delimiter = delimiter
         self.quotechar = quotechar
         self.encoding = encoding
@@ -107,6 +189,9 @@ class CSVReader(object):
 
     def read_lines(self):
         """Yields lines and add info to them (like line nr)."""
+        if self.stream:
+            yield from self._read_lines_stream()
+            return
         lines = self.data.splitlines()
         if ":" in self.rows_from_to:
             header = lines[0]
@@ -115,6 +200,9 @@ class CSVReader(object):
             lines = [
                 header,
             ] + lines[int(_from or 0) : int(_to or len(lines) + 1)]
+        yield from self._parse_lines(lines)
+
+    def _parse_lines(self, lines):
         reader = csv.DictReader(
             lines,
             delimiter=str(self.delimiter),
@@ -125,16 +213,295 @@ class CSVReader(object):
             line["_line_nr"] = reader.line_num
             yield line
 
+    def _open_stream(self):
+        if self.filepath:
+            return open(self.filepath, "rb", buffering=self.stream_chunk_size)
+        return io.BytesIO(self.bdata)
+
+    def _stream_encoding(self, fileobj):
+        if self.encoding:
+            return self.encoding
+        # guess it from a sample only
+        encoding = get_encoding(fileobj, sample_size=self.stream_chunk_size)["encoding"]
+        fileobj.seek(0)
+        try:
+            codecs.lookup(encoding or "")
+        except LookupError:
+            encoding = "utf-8"
+        return encoding
+
+    def _read_lines_stream(self):
+        with self._open_stream() as fileobj:
+            encoding = self._stream_encoding(fileobj)
+            # `newline=""` lets the csv module handle line breaks
+            # inside quoted values.
+            with io.TextIOWrapper(
+                fileobj, encoding=encoding, errors=LATIN1_FALLBACK_ERRORS, newline=""
+            ) as textobj:
+                lines = textobj
+                if ":" in self.rows_from_to:
+                    _from, _to = self.rows_from_to.split(":")
+                    lines = itertools.chain(
+                        [next(textobj, "")],
+                        itertools.islice(
+                            textobj, int(_from or 0), int(_to) if _to else None
+                        ),
+                    )
+                yield from self._parse_lines(lines)
+
+
+def get_line_size(line):
+    """Estimate the size in bytes of a line (a dict of values)."""
+    if isinstance(line, dict):
+        return sum(len(str(k)) + len(str(v)) for k, v in line.items())
+    return len(str(line))
 
-def gen_chunks(iterable, chunksize=10):
+
+def gen_chunks(iterable, chunksize=10, max_bytes=0):
     """Chunk generator.
 
     Take an iterable and yield `chunksize` sized slices.
+    If `max_bytes` is given, slices are cut as soon as
+    their estimated size in bytes would exceed it.
+    A falsy `chunksize` means no limit on the count of lines.
     """
     chunk = []
-    for i, line in enumerate(iterable):
-        if i % chunksize == 0 and i > 0:
+    chunk_bytes = 0
+    for line in iterable:
+        line_bytes = get_line_size(line) if max_bytes else 0
+        if chunk and (
+            (chunksize and len(chunk) >= chunksize)
+            or (max_bytes and chunk_bytes + line_bytes > max_bytes)
+        ):
             yield chunk
             del chunk[:]
+            chunk_bytes = 0
         chunk.append(line)
+        chunk_bytes += line_bytes
     yield chunk
+
+
+def get_sort_key(keys):
+    """Return a sort key function comparing lines on given `keys`."""
+
+    def sort_key(line):
+        return tuple(str(line.get(k) or "") for k in keys)
+
+    return sort_key
+
+
+def _spill_sorted_run(lines, key):
+    """Sort lines and dump them to a temporary file, ready to be read."""
+    lines.sort(key=key)
+    fileobj = tempfile.TemporaryFile()
+    for line in lines:
+        pickle.dump(line, fileobj, pickle.HIGHEST_PROTOCOL)
+    fileobj.seek(0)
+    return fileobj
+
+
+def _read_sorted_run(fileobj):
+    while True:
+        try:
+            yield pickle.load(fileobj)
+        except EOFError:
+            return
+
+
+def external_sort(lines, key, buffer_size=SORT_BUFFER_SIZE):
+    """Sort lines w/out loading all of them in memory.
+
+    Lines are sorted by runs of `buffer_size` lines spilled to temporary files,
+    then runs are merged back. Sorting is stable.
+    """
+    runs = []
+    buffer = []
+    try:
+        for line in lines:
+            buffer.append(line)
+            if len(buffer) >= buffer_size:
+                runs.append(_spill_sorted_run(buffer, key))
+                buffer = []
+        buffer.sort(key=key)
+        if not runs:
+            yield from buffer
+            return
+        logger.debug("External sort: merging %s runs", len(runs) + 1)
+        sorted_runs = [_read_sorted_run(x) for x in runs] + [iter(buffer)]
+        yield from heapq.merge(*sorted_runs, key=key)
+    finally:
+        for fileobj in runs:
+            fileobj.close()
+
+
+def is_ascii_compatible(encoding):
+    """Tell if CSV control chars are encoded as plain ASCII bytes.
+
+    This is required to cut files at byte level (eg: utf-8, latin-1).
+    """
+    try:
+        return '\n\r"'.encode(encoding) == b'\n\r"'
+    except (LookupError, TypeError):
+        return False
+
+
+def iter_record_offsets(fileobj, quotechar='"'):
+    """Yield `(start, end, lines_count)` for each CSV record.
+
+    Records are read from the current position of the binary `fileobj`.
+    A record can span more physical lines when it contains quoted line breaks:
+    a record is complete only when all the quotes are balanced.
+    """
+    quote = quotechar.encode("ascii")
+    start = offset = fileobj.tell()
+    lines_count = 0
+    quoted = False
+    for raw in fileobj:
+        offset += len(raw)
+        lines_count += 1
+        if raw.count(quote) % 2:
+            quoted = not quoted
+        if not quoted:
+            yield start, offset, lines_count
+            start = offset
+            lines_count = 0
+    if start < offset:
+        # unbalanced quotes until the end
+        yield start, offset, lines_count
+
+
+def gen_chunk_offsets(
+    fileobj,
+    chunksize=10,
+    quotechar='"',
+    start=None,
+    end=None,
+    line_nr=2,
+    max_bytes=0,
+):
+    """Chunk generator working on byte offsets.
+
+    Take a binary CSV file object and yield `(start, end, line_nr)`
+    for chunks of `chunksize` records, skipping the header.
+    `line_nr` is the line number of the 1st record of the chunk.
+    If `max_bytes` is given, chunks are cut as soon as
+    their size in bytes would exceed it.
+
+    Pass `start`, `end` and `line_nr` to chunk only a range of the file
+    (eg: one produced by `gen_range_offsets`).
+    """
+    if start is None:
+        fileobj.seek(0)
+        records = iter_record_offsets(fileobj, quotechar=quotechar)
+        header = next(records, None)
+        if header is None:
+            return
+        line_nr = header[2] + 1
+    else:
+        fileobj.seek(start)
+        records = iter_record_offsets(fileobj, quotechar=quotechar)
+    chunk_start = chunk_end = first_line_nr = None
+    count = 0
+    for rec_start, rec_end, lines_count in records:
+        if end is not None and rec_start >= end:
+            break
+        if max_bytes and chunk_start is not None and rec_end - chunk_start > max_bytes:
+            yield chunk_start, chunk_end, first_line_nr
+            chunk_start = None
+            count = 0
+        if chunk_start is None:
+            chunk_start, first_line_nr = rec_start, line_nr
+        chunk_end = rec_end
+        line_nr += lines_count
+        count += 1
+        if chunksize and count >= chunksize:
+            yield chunk_start, chunk_end, first_line_nr
+            chunk_start = None
+            count = 0
+    if chunk_start is not None:
+        yield chunk_start, chunk_end, first_line_nr
+
+
+def gen_range_offsets(fileobj, parts, quotechar='"', block_size=1024 * 1024):
+    """Split a binary CSV file object in `parts` byte ranges.
+
+    Yield `(start, end, line_nr)` for each range, skipping the header.
+    Ranges are aligned to record boundaries: to handle quoted line breaks
+    the quote state must be known, hence bytes are scanned once.
+    No decoding nor parsing happens, only bytes counting block by block.
+    """
+    size = fileobj.seek(0, io.SEEK_END)
+    fileobj.seek(0)
+    header = next(iter_record_offsets(fileobj, quotechar=quotechar), None)
+    if header is None:
+        return
+    data_start, line_nr = header[1], header[2] + 1
+    targets = [data_start + (size - data_start) * i // parts for i in range(1, parts)]
+    boundaries = [(data_start, line_nr)]
+    quote = quotechar.encode("ascii")
+    quoted = False
+    pos = data_start
+    fileobj.seek(data_start)
+    while targets:
+        block = fileobj.read(block_size)
+        if not block:
+            break
+        i = 0
+        while targets:
+            target = max(targets[0] - pos, i)
+            newline = block.find(b"\n", target)
+            if newline == -1:
+                break
+            segment = block[i : newline + 1]
+            quoted ^= bool(segment.count(quote) % 2)
+            line_nr += segment.count(b"\n")
+            i = newline + 1
+            if not quoted:
+                boundaries.append((pos + i, line_nr))
+                targets = [x for x in targets if x > pos + i]
+        segment = block[i:]
+        quoted ^= bool(segment.count(quote) % 2)
+        line_nr += segment.count(b"\n")
+        pos += len(block)
+    boundaries.append((size, None))
+    for (start, line_nr), (end, __) in zip(boundaries, boundaries[1:]):
+        if start < end:
+            yield start, end, line_nr
+
+
+def read_csv_range(
+    fileobj,
+    start,
+    end,
+    line_nr=2,
+    encoding=None,
+    delimiter=",",
+    quotechar='"',
+    fieldnames=None,
+):
+    """Parse CSV records found between `start` and `end` offsets.
+
+    Only the header and the given range are read from the binary `fileobj`.
+    Lines get `_line_nr` like `CSVReader.read_lines`.
+    """
+    fileobj.seek(0)
+    header = b""
+    if not fieldnames:
+        header_start, header_end, __ = next(
+            iter_record_offsets(fileobj, quotechar=quotechar)
+        )
+        fileobj.seek(header_start)
+        header = fileobj.read(header_end - header_start)
+    fileobj.seek(start)
+    data = csv_content_to_file(header + fileobj.read(end - start), encoding)
+    reader = csv.DictReader(
+        io.StringIO(str(data, "utf-8"), newline=""),
+        delimiter=str(delimiter),
+        quotechar=str(quotechar),
+        fieldnames=fieldnames,
+    )
+    # `line_num` counts the header too (when not given)
+    line_offset = line_nr - 1 - (0 if fieldnames else 1)
+    for line in reader:
+        line["_line_nr"] = line_offset + reader.line_num
+        yield line
@@ -0,0 +1,238 @@
+# Author: Simone Orsi
+# Copyright 2024 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+"""Process wide cache for relational lookups done by mappers.
+
+Lookups are cached by `(dbname, model, search field, operator, value)`.
+Entries are dropped when:
+
+* they expire (not found results have a shorter TTL)
+* the cache is full (least recently used first)
+* records of the model are created, written or deleted in this process
+* the registry of the database is reloaded
+
+Changes made by other processes are only seen once entries expire.
+Results are shared by all users: do not enable the cache for lookups
+depending on record rules.
+"""
+
+import contextlib
+import threading
+import time
+from collections import OrderedDict
+
+LOOKUP_CACHE_SIZE = 10000
+LOOKUP_CACHE_TTL = 600
+LOOKUP_CACHE_NEGATIVE_TTL = 30
+# search field used for lookups by xmlid
+XMLID_FIELD = "xmlid"
+# cursor data key for values to cache once committed
+PENDING_KEY = "connector_importer.lookup_cache"
+# cursor data key for the undo logs of open savepoints
+UNDO_KEY = PENDING_KEY + ".undo"
+_MISSING = object()
+
+
+class LookupCache:
+    """Thread safe LRU cache w/ TTL.
+
+    Each entry belongs to groups (eg: the model it refers to)
+    so that all the entries of a group can be invalidated at once.
+    """
+
+    def __init__(self, size=LOOKUP_CACHE_SIZE):
+        self.size = size
+        # key: (expire time, value, groups)
+        self._data = OrderedDict()
+        # group: keys
+        self._groups = {}
+        # dbname: registry sequence
+        self._sequences = {}
+        self._lock = threading.RLock()
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] < time.monotonic():
+                self._pop(key)
+                item = None
+            if item is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value, ttl, groups=()):
+        with self._lock:
+            self._pop(key)
+            self._data[key] = (time.monotonic() + ttl, value, tuple(groups))
+            for group in groups:
+                self._groups.setdefault(group, set()).add(key)
+            while len(self._data) > self.size:
+                self._pop(next(iter(self._data)))
+
+    def _pop(self, key):
+        item = self._data.pop(key, None)
+        if item is None:
+            return
+        for group in item[2]:
+            keys = self._groups.get(group)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._groups[group]
+
+    def has_group(self, group):
+        return group in self._groups
+
+    def invalidate(self, group, negative_only=False):
+        """Drop entries of given group, only not found ones if `negative_only`."""
+        with self._lock:
+            for key in list(self._groups.get(group, ())):
+                if negative_only and self._data[key][1]:
+                    continue
+                self._pop(key)
+
+    def check_sequence(self, dbname, sequence):
+        """Drop all entries of the database if its registry has been reloaded."""
+        if self._sequences.get(dbname) == sequence:
+            return
+        with self._lock:
+            self.invalidate((dbname,))
+            self._sequences[dbname] = sequence
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._groups.clear()
+            self._sequences.clear()
+            self.hits = self.misses = 0
+
+
+lookup_cache = LookupCache()
+
+
+def get_lookup_key(env, model_name, fname, operator, value):
+    """Return cache key for given lookup, None if the value is not hashable."""
+    if isinstance(value, list):
+        value = tuple(value)
+    key = (env.cr.dbname, model_name, fname, operator, value)
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def _get_groups(key):
+    dbname, model_name, fname = key[:3]
+    groups = [(dbname,), (dbname, model_name)]
+    if fname == XMLID_FIELD:
+        groups.append((dbname, "ir.model.data"))
+    return groups
+
+
+def get_lookup(env, key):
+    """Return cached value for given key or None."""
+    lookup_cache.check_sequence(env.cr.dbname, env.registry.registry_sequence)
+    return lookup_cache.get(key)
+
+
+def set_lookup(env, key, value, ttl=None, negative_ttl=None):
+    """Cache given value once the current transaction is committed.
+
+    This way values that are rolled back never reach the cache.
+    Values found inside a savepoint that is rolled back are discarded
+    only if the savepoint is wrapped in `pending_lookups_savepoint`.
+    """
+    if value:
+        ttl = LOOKUP_CACHE_TTL if ttl is None else ttl
+    else:
+        ttl = LOOKUP_CACHE_NEGATIVE_TTL if negative_ttl is None else negative_ttl
+    if ttl <= 0:
+        return
+    data = env.cr.postcommit.data
+    pending = data.get(PENDING_KEY)
+    if pending is None:
+        pending = data[PENDING_KEY] = {}
+        env.cr.postcommit.add(_flush_pending_lookups(data))
+    _log_undo(data, pending, key)
+    pending[key] = (value, ttl)
+
+
+def _log_undo(data, pending, key):
+    logs = data.get(UNDO_KEY)
+    if logs:
+        logs[-1].append((key, pending.get(key, _MISSING)))
+
+
+@contextlib.contextmanager
+def pending_lookups_savepoint(cr):
+    """Restore values pending for commit if the block fails.
+
+    To be used around savepoints: what has been found or changed
+    in a rolled back savepoint must not reach the cache.
+    """
+    data = cr.postcommit.data
+    logs = data.setdefault(UNDO_KEY, [])
+    log = []
+    logs.append(log)
+    try:
+        yield
+    except Exception:
+        pending = data.get(PENDING_KEY)
+        if pending is not None:
+            for key, value in reversed(log):
+                if value is _MISSING:
+                    pending.pop(key, None)
+                else:
+                    pending[key] = value
+        raise
+    else:
+        # changes are kept, unless the outer savepoint is rolled back
+        if len(logs) > 1:
+            logs[-2].extend(log)
+    finally:
+        logs.pop()
+
+
+def _flush_pending_lookups(data):
+    def flush():
+        for key, (value, ttl) in data.pop(PENDING_KEY, {}).items():
+            lookup_cache.set(key, value, ttl, groups=_get_groups(key))
+
+    return flush
+
+
+def has_lookups(env):
+    """Tell if anything is cached or pending for commit."""
+    return bool(lookup_cache) or bool(env.cr.postcommit.data.get(PENDING_KEY))
+
+
+def invalidate_lookups(env, model_name, negative_only=False):
+    """Invalidate cached lookups on given model now and once committed."""
+    group = (env.cr.dbname, model_name)
+    data = env.cr.postcommit.data
+    pending = data.get(PENDING_KEY)
+    if pending:
+        for key in list(pending):
+            if group in _get_groups(key) and not (negative_only and pending[key][0]):
+                _log_undo(data, pending, key)
+                del pending[key]
+    if not lookup_cache.has_group(group):
+        return
+    lookup_cache.invalidate(group, negative_only=negative_only)
+    # Other transactions of this process might cache outdated values
+    # until the changes are committed: invalidate again then.
+    invalidated = env.cr.postcommit.data.setdefault(PENDING_KEY + ".invalidated", set())
+    if (group, negative_only) not in invalidated:
+        invalidated.add((group, negative_only))
+        env.cr.postcommit.add(
+            lambda: lookup_cache.invalidate(group, negative_only=negative_only)
+        )
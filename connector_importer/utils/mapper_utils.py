@@ -10,6 +10,7 @@ from odoo import fields
 from odoo.tools.misc import str2bool
 
 from ..log import logger
+from ..utils.lookup_cache import XMLID_FIELD, get_lookup, get_lookup_key, set_lookup
 from ..utils.misc import sanitize_external_id
 
 FMTS = ("%d/%m/%Y",)
@@ -150,20 +151,60 @@ def concat(field, separator=" ", handler=None, **kw):
     return modifier
 
 
-def xmlid_to_rel(field, sanitize=True, sanitize_default_mod_name=None, **kw):
-    """Convert xmlids source values to ids."""
-    xmlid_to_rel._sanitize = sanitize
-    xmlid_to_rel._sanitize_default_mod_name = sanitize_default_mod_name
+def xmlid_to_rel(  # noqa: C901
+    field,
+    sanitize=True,
+    sanitize_default_mod_name=None,
+    lookup_cache=False,
+    lookup_cache_ttl=None,
+    lookup_cache_negative_ttl=None,
+    **kw
+):
+    """Convert xmlids source values to ids.
 
-    def _xid_to_record(env, xid):
-        xid = (
-            sanitize_external_id(
-                xid, default_mod_name=xmlid_to_rel._sanitize_default_mod_name
-            )
-            if xmlid_to_rel._sanitize
-            else xid
+    :param lookup_cache: cache resolved xmlids process wide
+        (see `utils.lookup_cache`)
+    :param lookup_cache_ttl: seconds to cache found records
+    :param lookup_cache_negative_ttl: seconds to cache not found records
+    """
+
+    def _sanitize(xid):
+        # NOTE: options must be kept per modifier, never on `xmlid_to_rel`
+        # as modifiers of different columns are used together.
+        if not sanitize:
+            return xid
+        return sanitize_external_id(xid, default_mod_name=sanitize_default_mod_name)
+
+    def _ref(self, xid):
+        # use external IDs resolved in batch by the importer if any
+        resolver = getattr(self, "_xmlid_resolver", None)
+        if resolver is not None:
+            return resolver.ref(xid)
+        return self.env.ref(xid, raise_if_not_found=False)
+
+    def _xid_to_record(self, xid, comodel_name):
+        env = self.env
+        xid = _sanitize(xid)
+        key = None
+        if lookup_cache:
+            key = get_lookup_key(env, comodel_name, XMLID_FIELD, "=", xid)
+        if key is None:
+            return _ref(self, xid)
+        cached = get_lookup(env, key)
+        if cached is not None:
+            return env[cached[0]].browse(cached[1]) if cached else None
+        rec = _ref(self, xid)
+        set_lookup(
+            env,
+            key,
+            (rec._name, rec.id) if rec else (),
+            ttl=lookup_cache_ttl,
+            negative_ttl=lookup_cache_negative_ttl,
         )
-        return env.ref(xid, raise_if_not_found=False)
+        return rec
+
+    def _split_values(value):
+        return [x.strip() for x in value.split(",") if x.strip()]
 
     def modifier(self, record, to_attr):
         value = record.get(field)
@@ -171,25 +212,39 @@ def xmlid_to_rel(field, sanitize=True, sanitize_default_mod_name=None, **kw):
             return None
         column = self.model._fields[to_attr]
         if column.type.endswith("2many"):
-            _values = [x.strip() for x in value.split(",") if x.strip()]
+            _values = _split_values(value)
             values = []
             rec_ids = []
             for xid in _values:
-                rec = _xid_to_record(self.env, xid)
+                rec = _xid_to_record(self, xid, column.comodel_name)
                 if rec:
                     rec_ids.append(rec.id)
             values.append((6, 0, rec_ids))
             return values
         elif column.type.endswith("many2one"):
             # m2o
-            rec = _xid_to_record(self.env, value)
+            rec = _xid_to_record(self, value, column.comodel_name)
             if rec:
                 return rec.id
             return None
         else:
             raise ValueError("Destination is not a related field.")
 
+    def prefetch_xmlids(self, record, to_attr):
+        """Return the external IDs to resolve for given record.
+
+        Used by mappers to resolve the external IDs of many records in batch.
+        """
+        value = record.get(field)
+        if value is None:
+            return []
+        column = self.model._fields[to_attr]
+        if column.type.endswith("2many"):
+            return [_sanitize(xid) for xid in _split_values(value)]
+        return [_sanitize(value)]
+
     modifier._from_key = field
+    modifier.prefetch_xmlids = prefetch_xmlids
     return modifier
 
 
@@ -208,6 +263,9 @@ def backend_to_rel(  # noqa: C901
     allowed_length=None,
     create_missing=False,
     create_missing_handler=None,
+    lookup_cache=False,
+    lookup_cache_ttl=None,
+    lookup_cache_negative_ttl=None,
     **kw
 ):
     """A modifier intended to be used on the ``direct`` mappings.
@@ -235,25 +293,71 @@ def backend_to_rel(  # noqa: C901
     :param create_missing: create a new record if not found
     :param create_missing_handler: provide an handler
         for getting new values for a new record to be created.
+    :param lookup_cache: cache search results process wide
+        (see `utils.lookup_cache`)
+    :param lookup_cache_ttl: seconds to cache found records
+    :param lookup_cache_negative_ttl: seconds to cache not found records.
+        Keep it short to let `create_missing` work across processes.
     """
 
     def modifier(self, record, to_attr):
-        search_value = _get_search_value(self, record, value_handler, field)
         column, rel_model = _get_column_and_model(self, to_attr)
+        search_args = _prepare_search(self, record, column, rel_model)
+        if not search_args:
+            return None
+        search_value = search_args[0][2]
+
+        # use values resolved in batch by the mapper if any
+        value = None
+        if getattr(self, "_rel_prefetch_cache", None):
+            value = self._get_prefetched_relation(rel_model, search_args)
+        if value is None:
+            value = _search(rel_model, search_args)
+
+        value = _handle_missing_values(
+            self, column, value, search_value, rel_model, record, to_attr
+        )
+
+        # handle the final value based on col type
+        return _handle_final_value(column, value)
+
+    def prefetch(self, record, to_attr):
+        """Return related model and search domain for given record.
+
+        Used by mappers to resolve the values of many records in batch.
+        """
+        column, rel_model = _get_column_and_model(self, to_attr)
+        search_args = _prepare_search(self, record, column, rel_model)
+        if not search_args:
+            return None
+        return rel_model, search_args
+
+    def _prepare_search(self, record, column, rel_model):
+        # NOTE: the modifier is reused for many records,
+        # never alter its attributes here.
+        search_value = _get_search_value(self, record, value_handler, field)
+        search_field = modifier.search_field
 
         # handle defaults if no search value here
-        if not search_value:
-            search_value = _handle_default_search_value()
+        if not search_value and default_search_value:
+            search_value = default_search_value
+            search_field = default_search_field or search_field
 
         # Support Odoo studio fields dynamically.
         # When a model is created automatically from Odoo studio
         # it gets an `x_name` field which cannot be modified :/
         if (
             not default_search_field
-            and modifier.search_field not in rel_model._fields
+            and search_field not in rel_model._fields
             and "x_name" in rel_model._fields
         ):
-            modifier.search_field = "x_name"
+            search_field = "x_name"
+
+        return _get_search_args(column, search_value, search_field)
+
+    def _get_search_args(column, search_value, search_field):
+        if not search_value:
+            return None
 
         if allowed_length and len(search_value) != allowed_length:
             return None
@@ -276,15 +380,33 @@ def backend_to_rel(  # noqa: C901
             # override by param
             search_operator = modifier.search_operator
 
-        search_args = [(modifier.search_field, search_operator, search_value)]
+        return [(search_field, search_operator, search_value)]
+
+    def _search(rel_model, search_args):
+        key = None
+        if lookup_cache:
+            ((search_field, search_operator, search_value),) = search_args
+            key = get_lookup_key(
+                rel_model.env,
+                rel_model._name,
+                search_field,
+                search_operator,
+                search_value,
+            )
+        if key is None:
+            return rel_model.search(search_args)
+        ids = get_lookup(rel_model.env, key)
+        if ids is not None:
+            return rel_model.browse(ids)
         value = rel_model.search(search_args)
-
-        value = _handle_missing_values(
-            self, column, value, search_value, rel_model, record, to_attr
+        set_lookup(
+            rel_model.env,
+            key,
+            tuple(value.ids),
+            ttl=lookup_cache_ttl,
+            negative_ttl=lookup_cache_negative_ttl,
         )
-
-        # handle the final value based on col type
-        return _handle_final_value(column, value)
+        return value
 
     def _get_search_value(self, record, value_handler, field):
         search_value = record.get(field)
@@ -297,13 +419,6 @@ def backend_to_rel(  # noqa: C901
         rel_model = self.env[column.comodel_name].with_context(active_test=False)
         return column, rel_model
 
-    def _handle_default_search_value():
-        if default_search_value:
-            search_value = default_search_value
-            if default_search_field:
-                modifier.search_field = default_search_field
-            return search_value
-
     def _handle_missing_values(
         self, column, value, search_value, rel_model, record, to_attr
     ):
@@ -324,6 +439,9 @@ def backend_to_rel(  # noqa: C901
             value = None
 
         if not value and create_missing:
+            if getattr(self, "_rel_prefetch_cache", None):
+                # values resolved in batch are outdated now
+                self._invalidate_prefetched_relations(rel_model._name)
             try:
                 if create_missing_handler:
                     value = create_missing_handler(self, rel_model, record)
@@ -356,4 +474,5 @@ def backend_to_rel(  # noqa: C901
     modifier.search_field = search_field or "name"
     modifier.search_operator = search_operator or None
     modifier._from_key = field
+    modifier.prefetch = prefetch
     return modifier
@@ -51,6 +51,86 @@ def sanitize_external_id(external_id, default_mod_name=None):
     return external_id
 
 
+# cursor cache key for external IDs created in the transaction
+NEW_XMLIDS_KEY = "connector_importer.new_xmlids"
+
+
+def track_new_xmlids(cr, xids):
+    """Remember external IDs created in the current transaction.
+
+    Lets `XMLIDResolver` know that external IDs not found before
+    might exist now, no matter who created them.
+    """
+    cr.cache.setdefault(NEW_XMLIDS_KEY, set()).update(xids)
+
+
+class XMLIDResolver:
+    """Resolve external IDs in batch.
+
+    Prefetched external IDs are looked up w/ 1 query on `ir.model.data`
+    per module and served from memory afterwards.
+    """
+
+    def __init__(self, env):
+        self.env = env
+        # xid: (model, res_id) or None if not found
+        self._cache = {}
+
+    def prefetch(self, xids):
+        """Resolve given external IDs at once.
+
+        :param xids: sanitized external IDs (see `sanitize_external_id`)
+        """
+        by_module = {}
+        for xid in xids:
+            if not xid or "." not in xid or xid in self._cache:
+                continue
+            module, name = xid.split(".", 1)
+            by_module.setdefault(module, set()).add(name)
+        found = {}
+        model_data = self.env["ir.model.data"].sudo()
+        for module, names in by_module.items():
+            res = model_data.search_read(
+                [("module", "=", module), ("name", "in", list(names))],
+                ["name", "model", "res_id"],
+            )
+            for item in res:
+                found[f"{module}.{item['name']}"] = (item["model"], item["res_id"])
+        by_model = {}
+        for model, res_id in found.values():
+            by_model.setdefault(model, []).append(res_id)
+        # like `env.ref` ignore dangling xmlids
+        existing = {
+            model: set(self.env[model].browse(ids).exists().ids)
+            for model, ids in by_model.items()
+            if model in self.env
+        }
+        for module, names in by_module.items():
+            for name in names:
+                xid = f"{module}.{name}"
+                model, res_id = found.get(xid, (None, None))
+                if res_id in existing.get(model, ()):
+                    self._cache[xid] = (model, res_id)
+                else:
+                    self._cache[xid] = None
+
+    def ref(self, xid):
+        """Same as `env.ref(xid, raise_if_not_found=False)`."""
+        item = self._cache.get(xid)
+        if item:
+            return self.env[item[0]].browse(item[1])
+        if item is None and xid in self._cache:
+            if xid not in self.env.cr.cache.get(NEW_XMLIDS_KEY, ()):
+                return None
+            # created in the meantime (eg: by another record handler)
+            del self._cache[xid]
+        return self.env.ref(xid, raise_if_not_found=False)
+
+    def set(self, xid, record):
+        """Make following lookups of `xid` return given record."""
+        self._cache[xid] = (record._name, record.id) if record else None
+
+
 def to_b64(file_content):
     """Safe convertion to b64"""
     try: